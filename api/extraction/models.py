@@ -19,6 +19,11 @@ CURRENCY_SYMBOL_MAP = {
 # Valid currency codes
 VALID_CURRENCIES = {"USD", "EUR", "GBP", "CAD", "AUD", "JPY"}
 
+# Symbols and codes resolved in one dict probe; codes map to themselves
+_CURRENCY_LOOKUP = {**CURRENCY_SYMBOL_MAP, **{c: c for c in VALID_CURRENCIES}}
+
+VALID_SEVERITIES = frozenset({"high", "medium", "low"})
+
 
 class ContractParty(BaseModel):
     """A party involved in the contract."""
@@ -40,7 +45,7 @@ class ContractRisk(BaseModel):
         """Normalize severity to lowercase."""
         if isinstance(v, str):
             v = v.lower().strip()
-            if v in ("high", "medium", "low"):
+            if v in VALID_SEVERITIES:
                 return v
         return "medium"
 
@@ -84,19 +89,8 @@ class ExtractionResult(BaseModel):
 
         v = str(v).strip()
 
-        # Check if it's a symbol
-        if v in CURRENCY_SYMBOL_MAP:
-            return CURRENCY_SYMBOL_MAP[v]
-
-        # Normalize to uppercase
-        v_upper = v.upper()
-
-        # Check if it's a valid currency code
-        if v_upper in VALID_CURRENCIES:
-            return v_upper
-
-        # Default to USD for unknown
-        return "USD"
+        # Exact symbol or code first, then case-insensitive code; default to USD for unknown
+        return _CURRENCY_LOOKUP.get(v) or _CURRENCY_LOOKUP.get(v.upper(), "USD")
 
     @field_validator("contract_type", mode="before")
     @classmethod
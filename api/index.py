@@ -1,17 +1,37 @@
 """Vercel serverless API using basic HTTP handler."""
 
 from http.server import BaseHTTPRequestHandler
-import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+import orjson
 import os
 import re
-from urllib.parse import urlparse, parse_qs
+import secrets
+from urllib.parse import parse_qs
 import base64
+import hashlib
+import hmac
 import io
+import logging
+import time
+import uuid
+
+import anthropic
+import google.generativeai as genai
+from supabase import create_client
+
+logger = logging.getLogger(__name__)
 
 # Supabase setup
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY", "")
 SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY", "")
+# Optional: lets HS256 access tokens be verified without calling Supabase Auth
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET", "")
+# Vercel Cron sends this as a bearer token to the scheduled endpoints
+CRON_SECRET = os.environ.get("CRON_SECRET", "")
 
 # AI Provider configuration
 # Options: "gemini" (default, cost-effective) or "claude" (higher quality)
@@ -19,76 +39,346 @@ AI_PROVIDER = os.environ.get("AI_PROVIDER", "gemini").lower()
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
 
+# Claude extraction is the escalation path for hard documents, so it keeps the
+# strongest model; recommendations are short structured JSON and use the fast one
+CLAUDE_EXTRACTION_MODEL = os.environ.get("CLAUDE_EXTRACTION_MODEL", "claude-opus-4-20251115")
+CLAUDE_RECOMMENDATIONS_MODEL = os.environ.get("CLAUDE_RECOMMENDATIONS_MODEL", "claude-haiku-4-5")
+# Contract Q&A keeps the model it has always used unless overridden
+CLAUDE_QA_MODEL = os.environ.get("CLAUDE_QA_MODEL", "claude-opus-4-20251115")
+
 # Constants
 MAX_FILES_PER_CONTRACT = 5
 
+BEARER_PREFIX = "Bearer "
 
-def get_supabase_client(use_service_key=True):
-    """Get Supabase client."""
-    from supabase import create_client
+HEALTH_PATHS = frozenset(("/api/", "/api/health"))
+
+# Parametric routes, compiled once at import
+CONTRACT_PATH_RE = re.compile(r"^/api/contracts/([^/]+)$")
+CONTRACT_FILES_PATH_RE = re.compile(r"^/api/contracts/([^/]+)/files$")
+CONTRACT_QUERY_PATH_RE = re.compile(r"^/api/contracts/([^/]+)/query$")
+RECOMMENDATION_PATH_RE = re.compile(r"^/api/recommendations/([^/]+)$")
+
+# Re-validate cached tokens this many seconds before they expire
+TOKEN_EXPIRY_MARGIN_SECONDS = 30
+
+# Cached tokens are re-checked at least this often. For tokens checked with
+# Supabase Auth this bounds how long a revoked session keeps working; locally
+# verified tokens stay valid until exp regardless
+TOKEN_CACHE_TTL_SECONDS = 30
+
+# Validated token digest -> (user_id, expires_at); digests avoid retaining raw tokens
+_TOKEN_CACHE = {}
+TOKEN_CACHE_MAX_ENTRIES = 10_000
+
+# Read-heavy dashboard responses are reused for a few seconds per user;
+# every mutation for the user invalidates them
+RESPONSE_CACHE_TTL_SECONDS = 10
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+
+# (user_id, endpoint) -> (data, expires_at)
+_RESPONSE_CACHE = {}
+
+# Upper bound for ?limit= on the contract list
+MAX_CONTRACTS_PAGE_SIZE = 100
+
+# Per-file limit matches the frontend; the body limit adds room for multipart framing
+MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024
+
+# PDF readers accept the %PDF- header anywhere in the first 1024 bytes
+PDF_HEADER = b"%PDF-"
+PDF_HEADER_SEARCH_BYTES = 1024
+MAX_UPLOAD_BYTES = MAX_FILES_PER_CONTRACT * MAX_FILE_SIZE_BYTES + 64 * 1024
+
+# Cap for every other request body: the JSON of updates, Q&A and bulk deletes
+MAX_JSON_BODY_BYTES = 64 * 1024
+
+# Only PDF uploads under this prefix may send up to MAX_UPLOAD_BYTES
+UPLOAD_PATH_PREFIX = "/api/upload/"
+
+# PostgREST (PGRST202) and Postgres (42883) codes for an RPC whose function does
+# not exist; only these fall back to the pre-migration Python paths
+MISSING_FUNCTION_CODES = frozenset({"PGRST202", "42883"})
+
+# PostgREST code for a requested range that starts past the last row
+RANGE_NOT_SATISFIABLE_CODE = "PGRST103"
+
+# Most contracts one bulk delete request may name
+MAX_BULK_DELETE_CONTRACTS = 100
+
+# Files read at extract time are staged here until confirm moves them
+PENDING_UPLOAD_PREFIX = "pending"
+UPLOAD_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+# Staged uploads older than this are refused by confirm and removed by the sweep
+PENDING_UPLOAD_TTL_SECONDS = 24 * 60 * 60
+PENDING_SWEEP_PATH = "/api/cron/sweep-pending"
+# Folders listed per storage call during the sweep
+PENDING_SWEEP_LIST_LIMIT = 1000
+# Work per sweep run, kept well inside the function's 60s maxDuration; anything
+# left over is picked up by the next run
+PENDING_SWEEP_MAX_UPLOADS = 500
+PENDING_SWEEP_BUDGET_SECONDS = 40
+# Paths per storage remove call
+PENDING_SWEEP_REMOVE_BATCH = 100
+
+# Request bodies are read in chunks of this size
+READ_CHUNK_SIZE = 256 * 1024
+
+# Numeric confirm params and the type each is cast to
+CONTRACT_NUMERIC_PARAMS = (
+    ("monthly_cost", float),
+    ("annual_cost", float),
+    ("cancellation_notice_days", int),
+)
+
+
+@lru_cache(maxsize=2)
+def _create_supabase_client(use_service_key):
+    """Create a Supabase client once per key so warm invocations reuse its HTTP pool."""
     key = SUPABASE_SERVICE_KEY if use_service_key else SUPABASE_ANON_KEY
     return create_client(SUPABASE_URL, key)
 
 
+def get_supabase_client(use_service_key=True):
+    """Get Supabase client."""
+    return _create_supabase_client(bool(use_service_key))
+
+
+@lru_cache(maxsize=1)
+def get_anthropic_client():
+    """Get Anthropic client, created once so warm invocations reuse its HTTP pool."""
+    return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+
+
+@lru_cache(maxsize=4)
+def get_gemini_model(model_name):
+    """Get a Gemini model, configuring the SDK on first use and reusing it per model name."""
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(model_name)
+
+
+def _b64url_decode(segment):
+    """Decode an unpadded base64url JWT segment."""
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _token_expiry(token):
+    """Read the exp claim from a JWT payload without verifying it (0 if absent)."""
+    try:
+        return float(orjson.loads(_b64url_decode(token.split(".")[1])).get("exp", 0))
+    except Exception:
+        return 0
+
+
+def verify_token_locally(token):
+    """Verify an HS256 Supabase access token against SUPABASE_JWT_SECRET.
+
+    Returns the user ID, or None when the token can't be checked locally (no
+    secret configured, or signed with an asymmetric key). Raises ValueError
+    for tokens that fail verification.
+    """
+    if not SUPABASE_JWT_SECRET:
+        return None
+
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = orjson.loads(_b64url_decode(header_b64))
+        signature = _b64url_decode(signature_b64)
+    except ValueError:
+        raise ValueError("Malformed token")
+    if header.get("alg") != "HS256":
+        return None
+
+    expected = hmac.new(
+        SUPABASE_JWT_SECRET.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256
+    ).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise ValueError("Invalid token signature")
+
+    payload = orjson.loads(_b64url_decode(payload_b64))
+    if payload.get("exp", 0) <= time.time():
+        raise ValueError("Token expired")
+    audience = payload.get("aud")
+    audiences = audience if isinstance(audience, list) else [audience]
+    if "authenticated" not in audiences:
+        raise ValueError("Invalid token audience")
+    return payload["sub"]
+
+
+def is_missing_function_error(error):
+    """Check whether an RPC failed only because its database function is not deployed."""
+    return getattr(error, "code", None) in MISSING_FUNCTION_CODES
+
+
+def is_uuid(value):
+    """Check whether a path or body id parses as a UUID, as every contract id does."""
+    try:
+        uuid.UUID(value)
+    except (ValueError, TypeError, AttributeError):
+        return False
+    return True
+
+
+def _make_room(cache, max_entries, now):
+    """Evict expired entries from a (value, expires_at) cache once it is full.
+
+    Clears the cache outright if everything in it is still live.
+    """
+    if len(cache) < max_entries:
+        return
+    for key in [k for k, (_, expires_at) in cache.items() if expires_at <= now]:
+        del cache[key]
+    if len(cache) >= max_entries:
+        cache.clear()
+
+
 def get_user_from_token(token):
-    """Get user ID from JWT token."""
-    from supabase import create_client
-    supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-    user = supabase.auth.get_user(token)
-    return user.user.id
+    """Get user ID from JWT token.
+
+    HS256 tokens are verified locally when SUPABASE_JWT_SECRET is set; others
+    go to Supabase Auth. Validated tokens are cached for TOKEN_CACHE_TTL_SECONDS,
+    or until shortly before their exp claim if that comes first, so warm
+    invocations skip the auth round trip. The unverified exp only bounds the
+    cache entry; it is never trusted on its own.
+
+    Only tokens checked with Supabase Auth see sign-outs and revocations, within
+    TOKEN_CACHE_TTL_SECONDS. Local verification cannot, so with
+    SUPABASE_JWT_SECRET set a validly signed token works until its exp.
+    """
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.time()
+    cached = _TOKEN_CACHE.get(key)
+    if cached and now < cached[1]:
+        return cached[0]
+
+    user_id = verify_token_locally(token)
+    if user_id is None:
+        supabase = get_supabase_client(use_service_key=False)
+        user = supabase.auth.get_user(token)
+        user_id = user.user.id
+
+    expires_at = min(_token_expiry(token) - TOKEN_EXPIRY_MARGIN_SECONDS, now + TOKEN_CACHE_TTL_SECONDS)
+    if expires_at > now:
+        _make_room(_TOKEN_CACHE, TOKEN_CACHE_MAX_ENTRIES, now)
+        _TOKEN_CACHE[key] = (user_id, expires_at)
+    return user_id
+
+
+def get_cached_response(user_id, endpoint):
+    """Return cached response data for a user's endpoint, or None if missing or expired."""
+    cached = _RESPONSE_CACHE.get((user_id, endpoint))
+    if cached and time.monotonic() < cached[1]:
+        return cached[0]
+    return None
+
+
+def set_cached_response(user_id, endpoint, data):
+    """Cache response data for RESPONSE_CACHE_TTL_SECONDS."""
+    now = time.monotonic()
+    _make_room(_RESPONSE_CACHE, RESPONSE_CACHE_MAX_ENTRIES, now)
+    _RESPONSE_CACHE[(user_id, endpoint)] = (data, now + RESPONSE_CACHE_TTL_SECONDS)
+
+
+def invalidate_cached_responses(user_id):
+    """Drop a user's cached responses after their contracts or recommendations change."""
+    for endpoint in ("summary", "recommendations"):
+        _RESPONSE_CACHE.pop((user_id, endpoint), None)
 
 
 def parse_authorization(headers):
-    """Extract token from Authorization header."""
-    auth = headers.get("Authorization", headers.get("authorization", ""))
-    if auth.startswith("Bearer "):
-        return auth[7:]
+    """Extract token from Authorization header.
+
+    Expects the handler's header Message, whose get() is already case-insensitive.
+    """
+    auth = headers.get("Authorization", "")
+    if auth.startswith(BEARER_PREFIX):
+        return auth[len(BEARER_PREFIX):]
     return auth
 
 
+# boundary="quoted" or boundary=token, possibly followed by other parameters
+_BOUNDARY_RE = re.compile(r'boundary=(?:"([^"]+)"|([^\s;]+))', re.IGNORECASE)
+# Content-Disposition parameters; \b keeps name= from matching inside filename=
+_PART_NAME_RE = re.compile(rb'\bname="([^"]*)"')
+_PART_FILENAME_RE = re.compile(rb'\bfilename="([^"]*)"')
+
+
+def _iter_multipart_parts(body, boundary):
+    """Yield (header bytes, content memoryview) for each part of a multipart body.
+
+    Accepts bytes or the bytearray produced by handler.read_body(). Content is
+    left as a view so callers can reject a part before copying it.
+
+    Walks the body with find() instead of split() so each part's content is
+    sliced exactly once, ending right before the next CRLF + delimiter.
+    """
+    delimiter = b"--" + boundary
+    separator = b"\r\n" + delimiter
+    view = memoryview(body)
+
+    pos = body.find(delimiter)
+    if pos == -1:
+        return
+    pos += len(delimiter)
+
+    # A delimiter followed by "--" closes the body
+    while body[pos:pos + 2] != b"--":
+        header_start = pos + 2  # skip CRLF after the delimiter
+        header_end = body.find(b"\r\n\r\n", header_start)
+        if header_end == -1:
+            return
+        content_start = header_end + 4
+        content_end = body.find(separator, content_start)
+        if content_end == -1:
+            return
+
+        yield view[header_start:header_end].tobytes(), view[content_start:content_end]
+        pos = content_end + len(separator)
+
+
 def parse_multipart_files(body, content_type):
-    """Parse multipart form data and extract all files."""
+    """Parse multipart form data and extract all files.
+
+    Raises ValueError for parts that are not PDFs or exceed MAX_FILE_SIZE_BYTES.
+    """
     files = []
     metadata = None
 
     if "multipart/form-data" not in content_type:
         return files, metadata
 
-    boundary = content_type.split("boundary=")[1].encode()
-    parts = body.split(b"--" + boundary)
-
-    for part in parts:
-        if b"filename=" in part:
-            # Extract headers
-            header_end = part.find(b"\r\n\r\n")
-            header = part[:header_end].decode()
+    boundary_match = _BOUNDARY_RE.search(content_type)
+    if not boundary_match:
+        return files, metadata
+    boundary = (boundary_match.group(1) or boundary_match.group(2)).encode()
 
-            # Extract filename
-            filename = None
-            if 'filename="' in header:
-                filename = header.split('filename="')[1].split('"')[0]
+    for header, content in _iter_multipart_parts(body, boundary):
+        # Extract field name to get document type
+        name_match = _PART_NAME_RE.search(header)
+        field_name = name_match.group(1).decode() if name_match else "file"
 
-            # Extract field name to get document type
-            field_name = "file"
-            if 'name="' in header:
-                field_name = header.split('name="')[1].split('"')[0]
+        filename_match = _PART_FILENAME_RE.search(header)
+        if filename_match:
+            filename = filename_match.group(1).decode()
 
-            # Extract file content
-            file_content = part[header_end + 4:].rstrip(b"\r\n--")
+            if filename and content:
+                # Checked on the view so rejected parts are never copied
+                if len(content) > MAX_FILE_SIZE_BYTES:
+                    raise ValueError(f"{filename} exceeds the {MAX_FILE_SIZE_BYTES // (1024 * 1024)}MB file size limit")
+                if PDF_HEADER not in content[:PDF_HEADER_SEARCH_BYTES].tobytes():
+                    raise ValueError(f"{filename} is not a PDF")
 
-            if filename and file_content:
                 files.append({
                     "filename": filename,
-                    "content": file_content,
+                    "content": content.tobytes(),
                     "field_name": field_name
                 })
 
         # Check for files_metadata JSON field
-        elif b'name="files_metadata"' in part:
-            header_end = part.find(b"\r\n\r\n")
-            content = part[header_end + 4:].rstrip(b"\r\n--")
+        elif field_name == "files_metadata":
             try:
-                metadata = json.loads(content.decode())
+                metadata = orjson.loads(content)
             except:
                 pass
 
@@ -112,28 +402,29 @@ INJECTION_PATTERNS = [
     r"return\s+this\s+exact",
     r"output\s+the\s+following",
     r"respond\s+with\s+only",
-    r"\[\[.*\]\]",  # Common injection delimiter
-    r"<\|.*\|>",   # Another common delimiter
+    r"\[\[[^\]]{0,200}\]\]",  # Common injection delimiter
+    r"<\|[^|>]{0,200}\|>",   # Another common delimiter
     r"###\s*SYSTEM",
     r"###\s*USER",
     r"###\s*ASSISTANT",
 ]
 
+# One alternation answers "any hit?" in a single pass over clean text; matches
+# can overlap, so the per-pattern regexes list what actually fired
+INJECTION_RE = re.compile("|".join(f"(?:{pattern})" for pattern in INJECTION_PATTERNS), re.IGNORECASE)
+INJECTION_PATTERN_RES = [(pattern, re.compile(pattern, re.IGNORECASE)) for pattern in INJECTION_PATTERNS]
+
+
 def detect_prompt_injection(text: str) -> tuple[bool, list[str]]:
     """Detect potential prompt injection attempts in document text.
 
     Returns:
         (is_suspicious, list of detected patterns)
     """
-    if not text:
+    if not text or not INJECTION_RE.search(text):
         return False, []
 
-    text_lower = text.lower()
-    detected = []
-
-    for pattern in INJECTION_PATTERNS:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            detected.append(pattern)
+    detected = [pattern for pattern, pattern_re in INJECTION_PATTERN_RES if pattern_re.search(text)]
 
     return len(detected) > 0, detected
 
@@ -287,9 +578,21 @@ Return ONLY the JSON object. Do not include any other text."""
 # Currency normalization
 CURRENCY_SYMBOL_MAP = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "C$": "CAD", "A$": "AUD"}
 VALID_CURRENCIES = {"USD", "EUR", "GBP", "CAD", "AUD", "JPY"}
-VALID_CONTRACT_TYPES = {"insurance", "utility", "subscription", "rental", "saas", "service", "other"}
-VALID_SEVERITIES = {"high", "medium", "low"}
-VALID_COMPLEXITIES = {"low", "medium", "high"}
+VALID_CONTRACT_TYPES = frozenset({"insurance", "utility", "subscription", "rental", "saas", "service", "other"})
+VALID_SEVERITIES = frozenset({"high", "medium", "low"})
+VALID_COMPLEXITIES = frozenset({"low", "medium", "high"})
+
+# Symbols and codes resolved in one dict probe; codes map to themselves
+_CURRENCY_LOOKUP = {**CURRENCY_SYMBOL_MAP, **{c: c for c in VALID_CURRENCIES}}
+
+
+# Phrases that show up when a model answers conversationally instead of extracting
+SUSPICIOUS_OUTPUTS = [
+    "i cannot", "i can't", "i am unable", "as an ai",
+    "i'm sorry", "i apologize", "here is", "here's the",
+    "certainly!", "of course!", "sure!", "absolutely!",
+]
+SUSPICIOUS_OUTPUT_RE = re.compile("|".join(map(re.escape, SUSPICIOUS_OUTPUTS)), re.IGNORECASE)
 
 
 def validate_extraction_output(data: dict) -> tuple[bool, list[str]]:
@@ -354,19 +657,14 @@ def validate_extraction_output(data: dict) -> tuple[bool, list[str]]:
             if not isinstance(term, str):
                 errors.append(f"key_term {i} is not a string")
 
-    # Check for suspicious output patterns (potential injection success)
-    suspicious_outputs = [
-        "i cannot", "i can't", "i am unable", "as an ai",
-        "i'm sorry", "i apologize", "here is", "here's the",
-        "certainly!", "of course!", "sure!", "absolutely!",
-    ]
     # Check if provider_name or key_terms contain suspicious AI responses
+    # (potential injection success)
     provider = data.get("provider_name") or ""
-    if any(s in provider.lower() for s in suspicious_outputs):
+    if SUSPICIOUS_OUTPUT_RE.search(provider):
         errors.append("provider_name contains suspicious AI response text")
 
     for term in key_terms if isinstance(key_terms, list) else []:
-        if isinstance(term, str) and any(s in term.lower() for s in suspicious_outputs):
+        if isinstance(term, str) and SUSPICIOUS_OUTPUT_RE.search(term):
             errors.append(f"key_term contains suspicious AI response text: {term[:50]}")
             break
 
@@ -378,24 +676,31 @@ def normalize_currency(v):
     if v is None:
         return "USD"
     v = str(v).strip()
-    if v in CURRENCY_SYMBOL_MAP:
-        return CURRENCY_SYMBOL_MAP[v]
-    v_upper = v.upper()
-    if v_upper in VALID_CURRENCIES:
-        return v_upper
-    return "USD"
+    return _CURRENCY_LOOKUP.get(v) or _CURRENCY_LOOKUP.get(v.upper(), "USD")
+
+
+def _cast_or_none(value, cast):
+    """Cast a model-supplied value, or return None if it is missing or malformed."""
+    if value is None:
+        return None
+    try:
+        return cast(value)
+    except (ValueError, TypeError):
+        return None
 
 
 def parse_extraction_result(raw_data: dict) -> dict:
     """Parse and normalize extraction result."""
+    contract_type = raw_data.get("contract_type")
+    payment_frequency = raw_data.get("payment_frequency")
     result = {
         "provider_name": raw_data.get("provider_name"),
         "contract_nickname": raw_data.get("contract_nickname"),
-        "contract_type": raw_data.get("contract_type", "").lower() if raw_data.get("contract_type") else None,
+        "contract_type": contract_type.lower() if contract_type else None,
         "monthly_cost": None,
         "annual_cost": None,
         "currency": normalize_currency(raw_data.get("currency")),
-        "payment_frequency": raw_data.get("payment_frequency", "").lower() if raw_data.get("payment_frequency") else None,
+        "payment_frequency": payment_frequency.lower() if payment_frequency else None,
         "start_date": raw_data.get("start_date"),
         "end_date": raw_data.get("end_date"),
         "auto_renewal": raw_data.get("auto_renewal"),
@@ -413,28 +718,10 @@ def parse_extraction_result(raw_data: dict) -> dict:
     }
 
     # Parse numeric fields
-    try:
-        if raw_data.get("monthly_cost") is not None:
-            result["monthly_cost"] = float(raw_data["monthly_cost"])
-    except (ValueError, TypeError):
-        pass
-
-    try:
-        if raw_data.get("annual_cost") is not None:
-            result["annual_cost"] = float(raw_data["annual_cost"])
-    except (ValueError, TypeError):
-        pass
+    for field, cast in CONTRACT_NUMERIC_PARAMS:
+        result[field] = _cast_or_none(raw_data.get(field), cast)
 
-    try:
-        if raw_data.get("cancellation_notice_days") is not None:
-            result["cancellation_notice_days"] = int(raw_data["cancellation_notice_days"])
-    except (ValueError, TypeError):
-        pass
-
-    try:
-        result["confidence"] = float(raw_data.get("confidence", 0.0))
-    except (ValueError, TypeError):
-        result["confidence"] = 0.0
+    result["confidence"] = _cast_or_none(raw_data.get("confidence", 0.0), float) or 0.0
 
     # Normalize risk severities
     for risk in result["risks"]:
@@ -477,27 +764,34 @@ def needs_escalation(extraction: dict) -> bool:
     return False
 
 
-def strip_json_markdown(text):
-    """Remove markdown code blocks from JSON response."""
-    text = text.strip()
-    if text.startswith("```json"):
-        text = text[7:]
-    if text.startswith("```"):
-        text = text[3:]
-    if text.endswith("```"):
-        text = text[:-3]
-    return text.strip()
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
 
 
-def extract_with_gemini(files, files_metadata, model_name="gemini-3-flash-preview"):
-    """Extract contract data using Google Gemini."""
-    import google.generativeai as genai
+def parse_json_response(text):
+    """Parse the JSON object in a model response.
+
+    Tries the text as-is first, then falls back to the outermost {...} span,
+    which skips markdown fences and any prose around the object.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+
+    match = _JSON_OBJECT_RE.search(text)
+    if not match:
+        raise ValueError(f"No JSON object in model response: {text[:200]!r}")
+    try:
+        return orjson.loads(match.group())
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in model response ({e}): {text[:200]!r}") from e
 
-    genai.configure(api_key=GEMINI_API_KEY)
 
+def extract_with_gemini(files, files_metadata, model_name="gemini-3-flash-preview"):
+    """Extract contract data using Google Gemini."""
     # Default: Gemini 3 Flash (fast, cost-effective)
     # Escalation options: gemini-2.0-pro (preferred), claude-sonnet-4 (fallback)
-    model = genai.GenerativeModel(model_name)
+    model = get_gemini_model(model_name)
 
     # Build content parts for Gemini
     parts = []
@@ -530,66 +824,100 @@ def extract_with_gemini(files, files_metadata, model_name="gemini-3-flash-previe
         }
     )
 
-    result_text = strip_json_markdown(response.text)
-    return json.loads(result_text)
+    return parse_json_response(response.text)
+
+
+# The extraction prompt is identical on every call, so it goes in a cached
+# system block and repeat extractions skip re-processing it
+EXTRACTION_SYSTEM_BLOCKS = [{
+    "type": "text",
+    "text": UNIFIED_EXTRACTION_PROMPT,
+    "cache_control": {"type": "ephemeral"}
+}]
 
 
 def extract_with_claude(files, files_metadata):
     """Extract contract data using Anthropic Claude Sonnet 4."""
-    import anthropic
-
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    client = get_anthropic_client()
 
-    # Build content array for Claude
-    content = []
+    # Build content array for Claude: a document and its caption per file
+    content = [None] * (2 * len(files))
 
     for i, file_data in enumerate(files):
-        base64_content = base64.standard_b64encode(file_data["content"]).decode("utf-8")
+        # Base64 output is pure ASCII, which decodes faster than UTF-8
+        base64_content = base64.b64encode(file_data["content"]).decode("ascii")
 
         # Add document
-        content.append({
+        content[2 * i] = {
             "type": "document",
             "source": {
                 "type": "base64",
                 "media_type": "application/pdf",
                 "data": base64_content
             }
-        })
+        }
 
         # Add context about the document
         doc_type = "unknown"
         if files_metadata and i < len(files_metadata):
             doc_type = files_metadata[i].get("document_type", "other")
-        content.append({
+        content[2 * i + 1] = {
             "type": "text",
             "text": f"Document {i+1}: {file_data['filename']} (Type: {doc_type})"
-        })
-
-    # Add extraction prompt
-    content.append({
-        "type": "text",
-        "text": UNIFIED_EXTRACTION_PROMPT
-    })
+        }
 
     response = client.messages.create(
-        model="claude-opus-4-20251115",
+        model=CLAUDE_EXTRACTION_MODEL,
         max_tokens=4096,
+        system=EXTRACTION_SYSTEM_BLOCKS,
         messages=[{
             "role": "user",
             "content": content
         }]
     )
 
-    result_text = strip_json_markdown(response.content[0].text)
-    return json.loads(result_text)
+    return parse_json_response(response.content[0].text)
+
+
+# Only the columns the recommendation prompt reads; full rows carry full_text
+RECOMMENDATION_CONTRACT_COLUMNS = (
+    "id,provider_name,contract_nickname,contract_type,monthly_cost,annual_cost,"
+    "start_date,end_date,auto_renewal,cancellation_notice_days,key_terms,risks"
+)
+
+# Per-contract caps on prompt lists; every item costs input tokens
+PROMPT_MAX_KEY_TERMS = 5
+PROMPT_MAX_RISKS = 2
+SEVERITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+
+def json_list(value):
+    """Return a JSONB list column as a list, decoding rows that stored it as a JSON string."""
+    if isinstance(value, str):
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return []
+    return value if isinstance(value, list) else []
+
+
+def top_risks(risks):
+    """Return the most severe risks, up to PROMPT_MAX_RISKS.
+
+    risks is client-supplied JSONB, so entries that are not objects are dropped
+    and severities that are not strings rank last.
+    """
+    def rank(risk):
+        severity = risk.get("severity")
+        return SEVERITY_RANK.get(severity.lower() if isinstance(severity, str) else None, len(SEVERITY_RANK))
+
+    ranked = sorted((r for r in json_list(risks) if isinstance(r, dict)), key=rank)
+    return ranked[:PROMPT_MAX_RISKS]
 
 
 def generate_recommendations_with_gemini(contracts_summary):
     """Generate recommendations using Gemini."""
-    import google.generativeai as genai
-
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel("gemini-3-flash-preview")
+    model = get_gemini_model("gemini-3-flash-preview")
 
     prompt = f"""Analyze these NEWLY ADDED contracts and provide actionable recommendations.
 
@@ -597,7 +925,7 @@ IMPORTANT: These are NEW contracts just uploaded by the user. Focus your analysi
 Do NOT reference or make assumptions about other contracts that may exist.
 
 NEW CONTRACTS TO ANALYZE:
-{json.dumps(contracts_summary, indent=2)}
+{orjson.dumps(contracts_summary, default=str).decode()}
 
 Generate recommendations in this JSON format. Each recommendation MUST reference a specific contract_id from the list above:
 
@@ -632,15 +960,12 @@ Provide 2-5 specific, actionable recommendations per contract. Return ONLY valid
         }
     )
 
-    result_text = strip_json_markdown(response.text)
-    return json.loads(result_text)
+    return parse_json_response(response.text)
 
 
 def generate_recommendations_with_claude(contracts_summary):
     """Generate recommendations using Claude."""
-    import anthropic
-
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    client = get_anthropic_client()
 
     prompt = f"""Analyze these NEWLY ADDED contracts and provide actionable recommendations.
 
@@ -648,7 +973,7 @@ IMPORTANT: These are NEW contracts just uploaded by the user. Focus your analysi
 Do NOT reference or make assumptions about other contracts that may exist.
 
 NEW CONTRACTS TO ANALYZE:
-{json.dumps(contracts_summary, indent=2)}
+{orjson.dumps(contracts_summary, default=str).decode()}
 
 Generate recommendations in this JSON format. Each recommendation MUST reference a specific contract_id from the list above:
 
@@ -675,25 +1000,223 @@ Focus on:
 Provide 2-5 specific, actionable recommendations per contract. Return ONLY valid JSON."""
 
     response = client.messages.create(
-        model="claude-opus-4-20251115",
+        model=CLAUDE_RECOMMENDATIONS_MODEL,
         max_tokens=4096,
         messages=[{"role": "user", "content": prompt}]
     )
 
-    result_text = strip_json_markdown(response.content[0].text)
-    return json.loads(result_text)
+    return parse_json_response(response.content[0].text)
+
+
+def upload_contract_file(supabase, file_path, content):
+    """Upload one PDF to the contracts storage bucket.
+
+    Failures propagate; every path includes a fresh id, so an existing object
+    is never expected.
+    """
+    supabase.storage.from_("contracts").upload(
+        file_path,
+        content,
+        {"content-type": "application/pdf"}
+    )
+
+
+def remove_contract_files(supabase, contract_id, paths):
+    """Remove contract files from storage, logging rather than raising on failure.
+
+    contract_id only labels the log message; bulk deletes pass several ids.
+    """
+    if not paths:
+        return
+    try:
+        removed = supabase.storage.from_("contracts").remove(paths)
+        if len(removed or []) < len(paths):
+            logger.warning("Removed %d of %d storage files for contract %s", len(removed or []), len(paths), contract_id)
+    except Exception:
+        logger.exception("Failed to remove storage files for contract %s", contract_id)
+
+
+def new_upload_token():
+    """Create an upload token whose hex prefix records when its files were staged."""
+    return f"{int(time.time()):x}-{secrets.token_urlsafe(16)}"
+
+
+def upload_token_expired(upload_token, now=None):
+    """Check an upload token's staging time against PENDING_UPLOAD_TTL_SECONDS.
+
+    Tokens without a readable timestamp count as expired.
+    """
+    try:
+        staged_at = int(upload_token.partition("-")[0], 16)
+    except ValueError:
+        return True
+    return (now or time.time()) - staged_at > PENDING_UPLOAD_TTL_SECONDS
+
+
+def stage_pending_files(supabase, user_id, files):
+    """Upload extracted PDFs under a pending prefix so confirm can reuse them.
+
+    Returns the upload token identifying the staged files. Failures propagate
+    so no token is handed out for an incomplete upload.
+    """
+    upload_token = new_upload_token()
+    prefix = f"{PENDING_UPLOAD_PREFIX}/{user_id}/{upload_token}"
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        list(executor.map(
+            lambda i, file_data: upload_contract_file(
+                supabase, f"{prefix}/{i}_{file_data['filename']}", file_data["content"]
+            ),
+            range(len(files)),
+            files,
+        ))
+    return upload_token
+
+
+def list_pending_files(supabase, user_id, upload_token):
+    """List the files staged for an upload token, in upload order."""
+    prefix = f"{PENDING_UPLOAD_PREFIX}/{user_id}/{upload_token}"
+    staged = []
+    for item in supabase.storage.from_("contracts").list(prefix):
+        index, _, filename = item["name"].partition("_")
+        staged.append((int(index), {
+            "filename": filename,
+            "size": (item.get("metadata") or {}).get("size", 0),
+            "pending_path": f"{prefix}/{item['name']}",
+        }))
+    return [file_data for _, file_data in sorted(staged, key=lambda s: s[0])]
+
+
+def remove_pending_files(supabase, user_id, upload_token):
+    """Remove every file staged under an upload token."""
+    paths = [file_data["pending_path"] for file_data in list_pending_files(supabase, user_id, upload_token)]
+    remove_contract_files(supabase, f"pending upload {upload_token}", paths)
+
+
+def discard_staged_upload(supabase, user_id, staging):
+    """Remove the files of a staging future whose token will never reach the client.
+
+    If staging itself failed, its partial upload is left for the sweep.
+    """
+    try:
+        upload_token = staging.result()
+    except Exception:
+        return
+    remove_pending_files(supabase, user_id, upload_token)
+
+
+def _list_storage_folder(bucket, path):
+    """Yield every entry of a storage folder, paging PENDING_SWEEP_LIST_LIMIT at a time."""
+    offset = 0
+    while True:
+        page = bucket.list(path, {"limit": PENDING_SWEEP_LIST_LIMIT, "offset": offset})
+        yield from page
+        if len(page) < PENDING_SWEEP_LIST_LIMIT:
+            return
+        offset += len(page)
+
+
+def sweep_pending_uploads(supabase, now=None):
+    """Remove staged uploads older than PENDING_UPLOAD_TTL_SECONDS for every user.
+
+    Expired uploads are collected before anything is removed, so deletions
+    can't shift the listing offsets. Each run handles at most
+    PENDING_SWEEP_MAX_UPLOADS within PENDING_SWEEP_BUDGET_SECONDS.
+    Returns the number of expired uploads removed.
+    """
+    bucket = supabase.storage.from_("contracts")
+    deadline = time.monotonic() + PENDING_SWEEP_BUDGET_SECONDS
+
+    expired = []
+    for user_folder in _list_storage_folder(bucket, PENDING_UPLOAD_PREFIX):
+        if len(expired) >= PENDING_SWEEP_MAX_UPLOADS or time.monotonic() > deadline:
+            break
+        user_id = user_folder["name"]
+        for token_folder in _list_storage_folder(bucket, f"{PENDING_UPLOAD_PREFIX}/{user_id}"):
+            if upload_token_expired(token_folder["name"], now):
+                expired.append((user_id, token_folder["name"]))
+    expired = expired[:PENDING_SWEEP_MAX_UPLOADS]
+    if not expired:
+        return 0
+
+    # Each upload's files are listed concurrently, then removed in batches
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        staged = executor.map(lambda upload: list_pending_files(supabase, *upload), expired)
+        paths = [file_data["pending_path"] for files in staged for file_data in files]
+    for start in range(0, len(paths), PENDING_SWEEP_REMOVE_BATCH):
+        remove_contract_files(supabase, "pending sweep", paths[start:start + PENDING_SWEEP_REMOVE_BATCH])
+    return len(expired)
+
+
+def summarize_contracts(contracts):
+    """Aggregate spend, type counts and renewal flags for the dashboard summary.
+
+    Categorical counts run as C-level Counter/sum passes; the loop only
+    handles the cost and date columns.
+    """
+    total_monthly = 0
+    total_annual = 0
+    expiring_soon = 0
+    # end_date is a DATE column, serialized as YYYY-MM-DD, which sorts chronologically
+    today = date.today()
+    today_iso = today.isoformat()
+    thirty_days_iso = (today + timedelta(days=30)).isoformat()
+
+    for c in contracts:
+        monthly_cost = c.get("monthly_cost")
+        if monthly_cost:
+            total_monthly += float(monthly_cost)
+        annual_cost = c.get("annual_cost")
+        if annual_cost:
+            total_annual += float(annual_cost)
+        end_date = c.get("end_date")
+        if end_date and today_iso <= end_date <= thirty_days_iso:
+            expiring_soon += 1
+
+    return {
+        "total_contracts": len(contracts),
+        "total_monthly_spend": total_monthly,
+        "total_annual_spend": total_annual,
+        "contracts_by_type": dict(Counter(c.get("contract_type") or "other" for c in contracts)),
+        "expiring_soon": expiring_soon,
+        "auto_renewal_count": sum(1 for c in contracts if c.get("auto_renewal")),
+    }
 
 
 class handler(BaseHTTPRequestHandler):
-    def send_json(self, data, status=200):
-        """Send JSON response."""
+    def send_json(self, data, status=200, headers=None):
+        """Send JSON response, with any extra headers."""
+        payload = orjson.dumps(data, default=str)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS")
         self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        self.send_header("Access-Control-Expose-Headers", "X-Total-Count")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(payload)
+
+    def read_body(self):
+        """Read the request body into one preallocated buffer.
+
+        readinto() fills the buffer in place, chunk by chunk, so large uploads
+        are never assembled from intermediate bytes objects.
+        """
+        content_length = int(self.headers.get("Content-Length", 0))
+        body = bytearray(content_length)
+        view = memoryview(body)
+        received = 0
+        while received < content_length:
+            n = self.rfile.readinto(view[received:received + READ_CHUNK_SIZE])
+            if not n:
+                break
+            received += n
+        view.release()
+        # Client sent less than it announced
+        del body[received:]
+        return body
 
     def send_error_json(self, message, status=400):
         """Send error JSON response."""
@@ -707,41 +1230,32 @@ class handler(BaseHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
         self.end_headers()
 
-    def do_GET(self):
-        """Handle GET requests."""
-        path = urlparse(self.path).path
-        query = parse_qs(urlparse(self.path).query)
+    def dispatch(self, method):
+        """Authenticate the request and route it to its handler method."""
+        # Request targets are origin-form, so splitting on "?" is all urlparse would do
+        path, _, query = self.path.partition("?")
 
         # Health endpoints
-        if path in ["/api/", "/api/health"]:
-            # Determine AI routing configuration
-            routing_config = {
-                "primary": "none",
-                "escalation": "none",
-                "smart_routing": False
-            }
+        if method == "GET" and path in HEALTH_PATHS:
+            return self.health()
 
-            if AI_PROVIDER == "claude" and ANTHROPIC_API_KEY:
-                routing_config["primary"] = "claude-sonnet-4"
-                routing_config["smart_routing"] = False
-            elif GEMINI_API_KEY:
-                routing_config["primary"] = "gemini-3-flash"
-                routing_config["smart_routing"] = True
-                routing_config["escalation"] = "gemini-2.5-pro"
-                if ANTHROPIC_API_KEY:
-                    routing_config["fallback"] = "claude-sonnet-4"
-            elif ANTHROPIC_API_KEY:
-                routing_config["primary"] = "claude-sonnet-4 (fallback)"
-                routing_config["smart_routing"] = False
+        # Scheduled jobs authenticate with CRON_SECRET instead of a user token
+        if method == "GET" and path == PENDING_SWEEP_PATH:
+            return self.sweep_pending()
 
-            return self.send_json({
-                "status": "healthy",
-                "service": "Clausemate API",
-                "ai_routing": routing_config
-            })
+        # Reject malformed and oversize bodies before reading them
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            return self.send_error_json("Invalid Content-Length", 400)
+        if content_length < 0:
+            return self.send_error_json("Invalid Content-Length", 400)
+        max_body = MAX_UPLOAD_BYTES if path.startswith(UPLOAD_PATH_PREFIX) else MAX_JSON_BODY_BYTES
+        if content_length > max_body:
+            return self.send_error_json("Payload too large", 413)
 
         # Auth required endpoints
-        token = parse_authorization(dict(self.headers))
+        token = parse_authorization(self.headers)
         if not token:
             return self.send_error_json("No token provided", 401)
 
@@ -750,585 +1264,598 @@ class handler(BaseHTTPRequestHandler):
         except Exception as e:
             return self.send_error_json(f"Invalid token: {str(e)}", 401)
 
-        supabase = get_supabase_client()
-
-        # Contracts endpoints
-        if path == "/api/contracts":
-            result = supabase.table("contracts").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-            # Also fetch file counts for each contract
-            contracts = result.data
-            for contract in contracts:
-                files_result = supabase.table("contract_files").select("id").eq("contract_id", contract["id"]).execute()
-                contract["file_count"] = len(files_result.data)
-            return self.send_json(contracts)
-
-        if path == "/api/contracts/summary":
-            from datetime import date, timedelta
-            result = supabase.table("contracts").select("*").eq("user_id", user_id).execute()
-            contracts = result.data
-
-            total_monthly = 0
-            total_annual = 0
-            by_type = {}
-            expiring_soon = 0
-            auto_renewal_count = 0
-            today = date.today()
-            thirty_days = today + timedelta(days=30)
-
-            for c in contracts:
-                if c.get("monthly_cost"):
-                    total_monthly += float(c["monthly_cost"])
-                if c.get("annual_cost"):
-                    total_annual += float(c["annual_cost"])
-                ctype = c.get("contract_type") or "other"
-                by_type[ctype] = by_type.get(ctype, 0) + 1
-                if c.get("end_date"):
-                    end = date.fromisoformat(c["end_date"])
-                    if today <= end <= thirty_days:
-                        expiring_soon += 1
-                if c.get("auto_renewal"):
-                    auto_renewal_count += 1
-
-            return self.send_json({
-                "total_contracts": len(contracts),
-                "total_monthly_spend": total_monthly,
-                "total_annual_spend": total_annual,
-                "contracts_by_type": by_type,
-                "expiring_soon": expiring_soon,
-                "auto_renewal_count": auto_renewal_count,
-            })
-
-        # Contract files endpoint
-        files_match = re.match(r"/api/contracts/([^/]+)/files", path)
-        if files_match:
-            contract_id = files_match.group(1)
-            # Verify ownership
-            contract = supabase.table("contracts").select("id").eq("id", contract_id).eq("user_id", user_id).execute()
-            if not contract.data:
-                return self.send_error_json("Contract not found", 404)
+        # Exact paths are one dict lookup; parametric paths try their patterns
+        route = ROUTES.get((method, path))
+        args = ()
+        if route is None:
+            for route_method, pattern, pattern_route in PATTERN_ROUTES:
+                match = pattern.match(path) if route_method == method else None
+                if match:
+                    route, args = pattern_route, match.groups()
+                    break
+            else:
+                return self.send_error_json("Not found", 404)
 
-            files_result = supabase.table("contract_files").select("*").eq("contract_id", contract_id).order("display_order").execute()
-            return self.send_json(files_result.data)
+        return route(self, get_supabase_client(), user_id, parse_qs(query), *args)
 
-        # Single contract endpoint
-        if path.startswith("/api/contracts/"):
-            contract_id = path.split("/")[-1]
-            result = supabase.table("contracts").select("*").eq("id", contract_id).eq("user_id", user_id).single().execute()
-            if not result.data:
-                return self.send_error_json("Contract not found", 404)
+    def do_GET(self):
+        """Handle GET requests."""
+        self.dispatch("GET")
 
-            # Also fetch files for this contract
-            files_result = supabase.table("contract_files").select("*").eq("contract_id", contract_id).order("display_order").execute()
-            result.data["files"] = files_result.data
-            return self.send_json(result.data)
+    def do_POST(self):
+        """Handle POST requests."""
+        self.dispatch("POST")
 
-        # Recommendations
-        if path == "/api/recommendations":
-            result = supabase.table("recommendations").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-            return self.send_json(result.data)
+    def do_PUT(self):
+        """Handle PUT requests."""
+        self.dispatch("PUT")
 
-        return self.send_error_json("Not found", 404)
+    def do_DELETE(self):
+        """Handle DELETE requests."""
+        self.dispatch("DELETE")
+
+    def health(self):
+        """Report service health and the AI routing configuration."""
+        # Determine AI routing configuration
+        routing_config = {
+            "primary": "none",
+            "escalation": "none",
+            "smart_routing": False
+        }
 
-    def do_POST(self):
-        """Handle POST requests."""
-        path = urlparse(self.path).path
-        query = parse_qs(urlparse(self.path).query)
+        if AI_PROVIDER == "claude" and ANTHROPIC_API_KEY:
+            routing_config["primary"] = "claude-sonnet-4"
+            routing_config["smart_routing"] = False
+        elif GEMINI_API_KEY:
+            routing_config["primary"] = "gemini-3-flash"
+            routing_config["smart_routing"] = True
+            routing_config["escalation"] = "gemini-2.5-pro"
+            if ANTHROPIC_API_KEY:
+                routing_config["fallback"] = "claude-sonnet-4"
+        elif ANTHROPIC_API_KEY:
+            routing_config["primary"] = "claude-sonnet-4 (fallback)"
+            routing_config["smart_routing"] = False
+
+        return self.send_json({
+            "status": "healthy",
+            "service": "Clausemate API",
+            "ai_routing": routing_config
+        })
 
-        token = parse_authorization(dict(self.headers))
-        if not token:
-            return self.send_error_json("No token provided", 401)
+    def list_contracts(self, supabase, user_id, query):
+        """GET /api/contracts"""
+        # Optional pagination; without limit every contract is returned
+        try:
+            limit = int(query["limit"][0]) if "limit" in query else None
+            offset = int(query.get("offset", ["0"])[0])
+        except ValueError:
+            return self.send_error_json("limit and offset must be integers", 400)
+        if limit is not None and (limit < 1 or offset < 0):
+            return self.send_error_json("limit must be positive and offset non-negative", 400)
+
+        # File counts come back inline from the embedded contract_files(count).
+        # The COUNT(*) for X-Total-Count only runs for paged requests; otherwise
+        # the total is the length of the response
+        request = supabase.table("contracts").select(
+            "*, contract_files(count)", count="exact" if limit is not None else None
+        ).eq("user_id", user_id).order("created_at", desc=True)
+        if limit is not None:
+            request = request.range(offset, offset + min(limit, MAX_CONTRACTS_PAGE_SIZE) - 1)
 
         try:
-            user_id = get_user_from_token(token)
+            result = request.execute()
         except Exception as e:
-            return self.send_error_json(f"Invalid token: {str(e)}", 401)
+            # An offset past the end is an empty page, not an error; count the total separately
+            if getattr(e, "code", None) != RANGE_NOT_SATISFIABLE_CODE:
+                raise
+            total = supabase.table("contracts").select("id", count="exact", head=True).eq(
+                "user_id", user_id
+            ).execute().count
+            return self.send_json([], headers={"X-Total-Count": str(total or 0)})
+
+        contracts = result.data
+        for contract in contracts:
+            embedded = contract.pop("contract_files", None) or [{}]
+            contract["file_count"] = embedded[0].get("count", 0)
+        total = (result.count or 0) if limit is not None else len(contracts)
+        return self.send_json(contracts, headers={"X-Total-Count": str(total)})
+
+    def get_summary(self, supabase, user_id, query):
+        """GET /api/contracts/summary"""
+        summary = get_cached_response(user_id, "summary")
+        if summary is not None:
+            return self.send_json(summary)
+
+        # Aggregate in Postgres (migration 008) so only one row crosses the wire
+        try:
+            summary = supabase.rpc("get_contract_summary", {"p_user_id": user_id}).execute().data
+        except Exception as e:
+            # Only a missing function falls back; a broken one must not silently
+            # turn every summary into a full-table Python aggregation
+            if not is_missing_function_error(e):
+                logger.exception("get_contract_summary failed")
+                return self.send_error_json(f"Failed to load summary: {type(e).__name__}", 500)
+            logger.warning("get_contract_summary is not deployed; aggregating in Python")
+            summary = None
+
+        if not summary:
+            # Fallback: aggregate in Python if the RPC is not deployed yet.
+            # Only the columns the aggregation reads; full rows carry key_terms/full_text
+            result = supabase.table("contracts").select(
+                "monthly_cost,annual_cost,contract_type,end_date,auto_renewal"
+            ).eq("user_id", user_id).execute()
+            summary = summarize_contracts(result.data)
+
+        set_cached_response(user_id, "summary", summary)
+        return self.send_json(summary)
+
+    def get_contract_files(self, supabase, user_id, query, contract_id):
+        """GET /api/contracts/{id}/files"""
+        # Ownership check and files in one request via the embedded contract_files
+        result = supabase.table("contracts").select("contract_files(*)").eq(
+            "id", contract_id
+        ).eq("user_id", user_id).order("display_order", foreign_table="contract_files").limit(1).execute()
+        if not result.data:
+            return self.send_error_json("Contract not found", 404)
+
+        return self.send_json(result.data[0]["contract_files"])
+
+    def get_contract(self, supabase, user_id, query, contract_id):
+        """GET /api/contracts/{id}"""
+        # The contract and its files come back in one request via the embedded contract_files
+        result = supabase.table("contracts").select("*, contract_files(*)").eq(
+            "id", contract_id
+        ).eq("user_id", user_id).order("display_order", foreign_table="contract_files").limit(1).execute()
+        if not result.data:
+            return self.send_error_json("Contract not found", 404)
+
+        contract = result.data[0]
+        contract["files"] = contract.pop("contract_files")
+        return self.send_json(contract)
+
+    def list_recommendations(self, supabase, user_id, query):
+        """GET /api/recommendations"""
+        recommendations = get_cached_response(user_id, "recommendations")
+        if recommendations is None:
+            result = supabase.table("recommendations").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+            recommendations = result.data
+            set_cached_response(user_id, "recommendations", recommendations)
+        return self.send_json(recommendations)
 
-        supabase = get_supabase_client()
+    def sweep_pending(self):
+        """GET /api/cron/sweep-pending - remove staged uploads that were never confirmed"""
+        token = parse_authorization(self.headers)
+        if not CRON_SECRET or not hmac.compare_digest(token.encode(), CRON_SECRET.encode()):
+            return self.send_error_json("Unauthorized", 401)
 
-        # Upload extract - supports multiple files
-        if path == "/api/upload/extract":
-            try:
-                content_length = int(self.headers.get("Content-Length", 0))
-                body = self.rfile.read(content_length)
-                content_type = self.headers.get("Content-Type", "")
-
-                # Parse all files from multipart
-                files, files_metadata = parse_multipart_files(body, content_type)
+        try:
+            swept = sweep_pending_uploads(get_supabase_client())
+        except Exception as e:
+            logger.exception("Pending upload sweep failed")
+            return self.send_error_json(f"Pending upload sweep failed: {type(e).__name__}", 500)
 
-                if not files:
-                    return self.send_error_json("No files uploaded", 400)
-
-                if len(files) > MAX_FILES_PER_CONTRACT:
-                    return self.send_error_json(f"Maximum {MAX_FILES_PER_CONTRACT} files allowed per contract", 400)
-
-                # Security check: Detect prompt injection in filenames
-                security_flags = []
-                for f in files:
-                    filename = f.get("filename", "")
-                    is_suspicious, patterns = detect_prompt_injection(filename)
-                    if is_suspicious:
-                        security_flags.append(f"Suspicious filename detected: {filename[:50]}")
-
-                # Smart routing: Start with Gemini 3 Flash, escalate if needed
-                escalated = False
-                escalation_model = None
-
-                if AI_PROVIDER == "claude" and ANTHROPIC_API_KEY:
-                    # If explicitly set to Claude, use Claude directly
-                    raw_data = extract_with_claude(files, files_metadata)
-                elif GEMINI_API_KEY:
-                    # Default: Gemini 3 Flash (fast, cost-effective)
-                    raw_data = extract_with_gemini(files, files_metadata, "gemini-3-flash-preview")
-
-                    # Parse initial result to check for escalation
-                    initial_extraction = parse_extraction_result(raw_data)
-
-                    # Smart routing: escalate if low confidence or high complexity
-                    if needs_escalation(initial_extraction):
-                        # Try Gemini Pro first (preferred), fallback to Claude Sonnet 4
-                        try:
-                            raw_data = extract_with_gemini(files, files_metadata, "gemini-2.5-pro")
-                            escalated = True
-                            escalation_model = "gemini-2.5-pro"
-                        except Exception as gemini_error:
-                            # Fallback to Claude Sonnet 4 if Gemini Pro fails
-                            if ANTHROPIC_API_KEY:
-                                raw_data = extract_with_claude(files, files_metadata)
-                                escalated = True
-                                escalation_model = "claude-sonnet-4"
-                            else:
-                                raise gemini_error
-                elif ANTHROPIC_API_KEY:
-                    # Fallback to Claude if Gemini key not available
-                    raw_data = extract_with_claude(files, files_metadata)
-                else:
-                    return self.send_error_json("No AI provider configured. Set GEMINI_API_KEY or ANTHROPIC_API_KEY.", 500)
-
-                # Validate AI output structure
-                is_valid, validation_errors = validate_extraction_output(raw_data)
-
-                # Parse and normalize the extraction result
-                extraction = parse_extraction_result(raw_data)
-
-                # If validation failed, flag as suspicious and reduce confidence
-                if not is_valid:
-                    extraction["security_warning"] = "Output validation failed"
-                    extraction["validation_errors"] = validation_errors
-                    extraction["confidence"] = min(extraction.get("confidence", 0.5), 0.4)
-                    # Add a risk about suspicious content
-                    if not any(r.get("title") == "Suspicious Document Content" for r in extraction.get("risks", [])):
-                        extraction["risks"].append({
-                            "title": "Suspicious Document Content",
-                            "description": "The document may contain content attempting to manipulate extraction. Review results carefully.",
-                            "severity": "high"
-                        })
-
-                # Add file names and routing info
-                extraction["file_names"] = [f["filename"] for f in files]
-                extraction["escalated"] = escalated
-                if escalation_model:
-                    extraction["escalation_model"] = escalation_model
-
-                # Add security flags if any issues detected
-                if security_flags:
-                    extraction["security_flags"] = security_flags
-                    extraction["confidence"] = min(extraction.get("confidence", 0.5), 0.5)
-
-                return self.send_json(extraction)
+        return self.send_json({"swept": swept})
 
-            except Exception as e:
-                import traceback
-                error_details = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
-                return self.send_error_json(f"Extraction failed: {error_details}", 500)
+    def upload_extract(self, supabase, user_id, query):
+        """POST /api/upload/extract - supports multiple files"""
+        staging = None
+        try:
+            body = self.read_body()
+            content_type = self.headers.get("Content-Type", "")
 
-        # Upload confirm - supports multiple files
-        if path == "/api/upload/confirm":
+            # Parse all files from multipart
             try:
-                content_length = int(self.headers.get("Content-Length", 0))
-                body = self.rfile.read(content_length)
-                content_type = self.headers.get("Content-Type", "")
-
-                # Get query parameters
-                params = {k: v[0] for k, v in query.items()}
-                provider_name = params.get("provider_name", "").strip()
-
-                if not provider_name:
-                    return self.send_error_json("Provider name is required", 400)
-
-                # Parse all files from multipart
                 files, files_metadata = parse_multipart_files(body, content_type)
+            except ValueError as e:
+                return self.send_error_json(str(e), 400)
 
-                if not files:
-                    return self.send_error_json("No files uploaded", 400)
+            if not files:
+                return self.send_error_json("No files uploaded", 400)
 
-                if len(files) > MAX_FILES_PER_CONTRACT:
-                    return self.send_error_json(f"Maximum {MAX_FILES_PER_CONTRACT} files allowed per contract", 400)
+            if len(files) > MAX_FILES_PER_CONTRACT:
+                return self.send_error_json(f"Maximum {MAX_FILES_PER_CONTRACT} files allowed per contract", 400)
 
-                # Parse JSON fields from query params
-                key_terms = None
-                if params.get("key_terms"):
-                    try:
-                        key_terms = json.loads(params["key_terms"])
-                    except json.JSONDecodeError:
-                        key_terms = None
-
-                parties = None
-                if params.get("parties"):
-                    try:
-                        parties = json.loads(params["parties"])
-                    except json.JSONDecodeError:
-                        parties = None
+            if not (GEMINI_API_KEY or ANTHROPIC_API_KEY):
+                return self.send_error_json("No AI provider configured. Set GEMINI_API_KEY or ANTHROPIC_API_KEY.", 500)
 
-                risks = None
-                if params.get("risks"):
-                    try:
-                        risks = json.loads(params["risks"])
-                    except json.JSONDecodeError:
-                        risks = None
-
-                # Create contract record first (without file_path/file_name for multi-file)
-                contract_data = {
-                    "user_id": user_id,
-                    "provider_name": provider_name,
-                    "contract_nickname": params.get("contract_nickname"),
-                    "contract_type": params.get("contract_type"),
-                    "monthly_cost": float(params["monthly_cost"]) if params.get("monthly_cost") else None,
-                    "annual_cost": float(params["annual_cost"]) if params.get("annual_cost") else None,
-                    "currency": params.get("currency", "USD"),
-                    "start_date": params.get("start_date"),
-                    "end_date": params.get("end_date"),
-                    "auto_renewal": params.get("auto_renewal", "true").lower() == "true",
-                    "cancellation_notice_days": int(params["cancellation_notice_days"]) if params.get("cancellation_notice_days") else None,
-                    "key_terms": key_terms,
-                    "parties": parties,
-                    "risks": risks,
-                    "user_verified": True,
-                    # RAG fields
-                    "full_text": extraction.get("full_text", ""),
-                }
+            # Stage the PDFs for confirm while the model reads them
+            stager = ThreadPoolExecutor(max_workers=1)
+            staging = stager.submit(stage_pending_files, supabase, user_id, files)
+            stager.shutdown(wait=False)
 
-                # For backward compatibility, set file_path and file_name from first file
-                if files:
-                    first_file = files[0]
-                    contract_data["file_name"] = first_file["filename"]
+            # Security check: Detect prompt injection in filenames
+            security_flags = []
+            for f in files:
+                filename = f.get("filename", "")
+                is_suspicious, patterns = detect_prompt_injection(filename)
+                if is_suspicious:
+                    security_flags.append(f"Suspicious filename detected: {filename[:50]}")
 
-                contract_data = {k: v for k, v in contract_data.items() if v is not None}
+            # Smart routing: Start with Gemini 3 Flash, escalate if needed
+            escalated = False
+            escalation_model = None
 
-                result = supabase.table("contracts").insert(contract_data).execute()
-                contract_id = result.data[0]["id"]
-
-                # Insert text chunks for RAG
-                chunks = extraction.get("chunks", [])
-                if chunks:
-                    for chunk in chunks:
-                        try:
-                            supabase.table("contract_chunks").insert({
-                                "contract_id": contract_id,
-                                "chunk_text": chunk.get("text", ""),
-                                "chunk_index": chunk.get("index", 0),
-                                "source_file": files[0]["filename"] if files else None,
-                            })
-                        except Exception:
-                            pass  # Skip chunk insertion errors
-
-                # Upload each file to storage and create contract_files records
-                for i, file_data in enumerate(files):
-                    filename = file_data["filename"]
-                    file_content = file_data["content"]
-
-                    # Get metadata for this file
-                    doc_type = "other"
-                    label = filename
-                    if files_metadata and i < len(files_metadata):
-                        doc_type = files_metadata[i].get("document_type", "other")
-                        label = files_metadata[i].get("label", filename)
+            if AI_PROVIDER == "claude" and ANTHROPIC_API_KEY:
+                # If explicitly set to Claude, use Claude directly
+                raw_data = extract_with_claude(files, files_metadata)
+            elif GEMINI_API_KEY:
+                # Default: Gemini 3 Flash (fast, cost-effective)
+                raw_data = extract_with_gemini(files, files_metadata, "gemini-3-flash-preview")
 
-                    # Storage path includes contract_id
-                    file_path = f"{user_id}/{contract_id}/{filename}"
+                # Parse initial result to check for escalation
+                initial_extraction = parse_extraction_result(raw_data)
 
+                # Smart routing: escalate if low confidence or high complexity
+                if needs_escalation(initial_extraction):
+                    # Try Gemini Pro first (preferred), fallback to Claude Sonnet 4
                     try:
-                        supabase.storage.from_("contracts").upload(
-                            file_path,
-                            file_content,
-                            {"content-type": "application/pdf"}
-                        )
-                    except Exception as e:
-                        if "already exists" not in str(e).lower():
-                            pass  # Ignore upload errors
-
-                    # Create contract_files record
-                    supabase.table("contract_files").insert({
-                        "contract_id": contract_id,
-                        "file_path": file_path,
-                        "file_name": filename,
-                        "file_size_bytes": len(file_content),
-                        "document_type": doc_type,
-                        "label": label,
-                        "display_order": i
-                    }).execute()
-
-                # Also update the contract with the first file's path (for backward compatibility)
-                if files:
-                    first_file_path = f"{user_id}/{contract_id}/{files[0]['filename']}"
-                    supabase.table("contracts").update({
-                        "file_path": first_file_path
-                    }).eq("id", contract_id).execute()
-
-                # Return the created contract with files
-                contract_result = supabase.table("contracts").select("*").eq("id", contract_id).single().execute()
-                files_result = supabase.table("contract_files").select("*").eq("contract_id", contract_id).order("display_order").execute()
-                contract_result.data["files"] = files_result.data
-
-                return self.send_json(contract_result.data)
+                        raw_data = extract_with_gemini(files, files_metadata, "gemini-2.5-pro")
+                        escalated = True
+                        escalation_model = "gemini-2.5-pro"
+                    except Exception as gemini_error:
+                        # Fallback to Claude Sonnet 4 if Gemini Pro fails
+                        if ANTHROPIC_API_KEY:
+                            raw_data = extract_with_claude(files, files_metadata)
+                            escalated = True
+                            escalation_model = "claude-sonnet-4"
+                        else:
+                            raise gemini_error
+            else:
+                # Fallback to Claude if Gemini key not available
+                raw_data = extract_with_claude(files, files_metadata)
+
+            # Validate AI output structure
+            is_valid, validation_errors = validate_extraction_output(raw_data)
+
+            # Parse and normalize the extraction result
+            extraction = parse_extraction_result(raw_data)
+
+            # If validation failed, flag as suspicious and reduce confidence
+            if not is_valid:
+                extraction["security_warning"] = "Output validation failed"
+                extraction["validation_errors"] = validation_errors
+                extraction["confidence"] = min(extraction.get("confidence", 0.5), 0.4)
+                # Add a risk about suspicious content
+                if not any(r.get("title") == "Suspicious Document Content" for r in extraction.get("risks", [])):
+                    extraction["risks"].append({
+                        "title": "Suspicious Document Content",
+                        "description": "The document may contain content attempting to manipulate extraction. Review results carefully.",
+                        "severity": "high"
+                    })
 
-            except Exception as e:
-                import traceback
-                error_details = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
-                return self.send_error_json(f"Failed to save contract: {error_details}", 500)
+            # Add file names and routing info
+            extraction["file_names"] = [f["filename"] for f in files]
+            extraction["escalated"] = escalated
+            if escalation_model:
+                extraction["escalation_model"] = escalation_model
 
-        # Generate recommendations using AI
-        if path == "/api/recommendations/generate":
-            try:
-                # Fetch all user's contracts
-                contracts = supabase.table("contracts").select("*").eq("user_id", user_id).execute()
-
-                if not contracts.data:
-                    return self.send_json([])
-
-                # Get contract IDs that already have recommendations (any status)
-                existing_recs = supabase.table("recommendations").select("contract_id").eq("user_id", user_id).execute()
-                analyzed_contract_ids = set()
-                for rec in (existing_recs.data or []):
-                    if rec.get("contract_id"):
-                        analyzed_contract_ids.add(rec["contract_id"])
-
-                # Filter to only NEW contracts (not yet analyzed)
-                new_contracts = [c for c in contracts.data if c["id"] not in analyzed_contract_ids]
-
-                if not new_contracts:
-                    # No new contracts to analyze
-                    return self.send_json([])
-
-                # Build context for AI - only new contracts
-                contracts_summary = []
-                for c in new_contracts:
-                    contracts_summary.append({
-                        "id": c["id"],
-                        "provider": c.get("provider_name"),
-                        "nickname": c.get("contract_nickname"),
-                        "type": c.get("contract_type"),
-                        "monthly_cost": c.get("monthly_cost"),
-                        "annual_cost": c.get("annual_cost"),
-                        "start_date": c.get("start_date"),
-                        "end_date": c.get("end_date"),
-                        "auto_renewal": c.get("auto_renewal"),
-                        "cancellation_notice_days": c.get("cancellation_notice_days"),
-                        "key_terms": c.get("key_terms", []),
-                        "risks": c.get("risks", []),
-                    })
+            # Add security flags if any issues detected
+            if security_flags:
+                extraction["security_flags"] = security_flags
+                extraction["confidence"] = min(extraction.get("confidence", 0.5), 0.5)
 
-                # Use configured AI provider
-                if AI_PROVIDER == "claude" and ANTHROPIC_API_KEY:
-                    ai_result = generate_recommendations_with_claude(contracts_summary)
-                elif GEMINI_API_KEY:
-                    ai_result = generate_recommendations_with_gemini(contracts_summary)
-                elif ANTHROPIC_API_KEY:
-                    # Fallback to Claude if Gemini key not available
-                    ai_result = generate_recommendations_with_claude(contracts_summary)
-                else:
-                    return self.send_error_json("No AI provider configured. Set GEMINI_API_KEY or ANTHROPIC_API_KEY.", 500)
-
-                recommendations = ai_result.get("recommendations", [])
-
-                # Insert new recommendations (don't delete old ones - they're for previous contracts)
-                inserted = []
-                for rec in recommendations:
-                    rec_data = {
-                        "user_id": user_id,
-                        "contract_id": rec.get("contract_id"),
-                        "type": rec.get("type", "cost_reduction"),
-                        "title": rec.get("title", "Recommendation"),
-                        "description": rec.get("description", ""),
-                        "estimated_savings": rec.get("estimated_savings"),
-                        "priority": rec.get("priority", "medium"),
-                        "status": "pending",
-                        "reasoning": rec.get("reasoning"),
-                    }
-                    result = supabase.table("recommendations").insert(rec_data).execute()
-                    if result.data:
-                        inserted.append(result.data[0])
-
-                return self.send_json(inserted)
+            # Without a token the client re-sends the files to confirm
+            try:
+                extraction["upload_token"] = staging.result()
+            except Exception:
+                pass
 
-            except Exception as e:
-                import traceback
-                error_details = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
-                return self.send_error_json(f"Failed to generate recommendations: {error_details}", 500)
+            return self.send_json(extraction)
 
-        return self.send_error_json("Not found", 404)
+        except Exception as e:
+            # The client never gets the token, so its staged files would never be confirmed
+            if staging is not None:
+                discard_staged_upload(supabase, user_id, staging)
+            # Details stay in the server log; clients only see the error class
+            logger.exception("Extraction failed")
+            return self.send_error_json(f"Extraction failed: {type(e).__name__}", 500)
+
+    def upload_confirm(self, supabase, user_id, query):
+        """POST /api/upload/confirm - supports multiple files"""
+        try:
+            body = self.read_body()
+            content_type = self.headers.get("Content-Type", "")
+
+            # Get query parameters
+            params = {k: v[0] for k, v in query.items()}
+            provider_name = params.get("provider_name", "").strip()
+
+            if not provider_name:
+                return self.send_error_json("Provider name is required", 400)
+
+            upload_token = params.get("upload_token")
+            if upload_token:
+                # Files were staged by extract; the body only carries their metadata
+                if not UPLOAD_TOKEN_RE.match(upload_token):
+                    return self.send_error_json("Invalid upload token", 400)
+                if upload_token_expired(upload_token):
+                    return self.send_error_json("Upload token expired; upload the files again", 400)
+                try:
+                    files_metadata = orjson.loads(body or b"{}").get("files_metadata")
+                except (orjson.JSONDecodeError, AttributeError):
+                    return self.send_error_json("Invalid request body", 400)
+                files = list_pending_files(supabase, user_id, upload_token)
+            else:
+                # Parse all files from multipart
+                try:
+                    files, files_metadata = parse_multipart_files(body, content_type)
+                except ValueError as e:
+                    return self.send_error_json(str(e), 400)
+
+            if files_metadata is not None and not (
+                isinstance(files_metadata, list) and all(isinstance(m, dict) for m in files_metadata)
+            ):
+                return self.send_error_json("files_metadata must be a list of objects", 400)
+
+            if not files:
+                return self.send_error_json("No files uploaded", 400)
+
+            if len(files) > MAX_FILES_PER_CONTRACT:
+                return self.send_error_json(f"Maximum {MAX_FILES_PER_CONTRACT} files allowed per contract", 400)
+
+            # The id is generated here so storage paths are known before the insert
+            contract_id = str(uuid.uuid4())
+            contract_data = {
+                "id": contract_id,
+                "user_id": user_id,
+                "provider_name": provider_name,
+                "currency": params.get("currency", "USD"),
+                "auto_renewal": params.get("auto_renewal", "true").lower() == "true",
+                "user_verified": True,
+                # For backward compatibility, set file_name from first file
+                "file_name": files[0]["filename"],
+                "file_path": f"{user_id}/{contract_id}/{files[0]['filename']}",
+            }
 
-    def do_PUT(self):
-        """Handle PUT requests."""
-        path = urlparse(self.path).path
+            # Optional fields are only sent when present so column defaults apply
+            for field in ("contract_nickname", "contract_type", "start_date", "end_date"):
+                if params.get(field):
+                    contract_data[field] = params[field]
 
-        token = parse_authorization(dict(self.headers))
-        if not token:
-            return self.send_error_json("No token provided", 401)
+            for field, cast in CONTRACT_NUMERIC_PARAMS:
+                if params.get(field):
+                    contract_data[field] = cast(params[field])
 
-        try:
-            user_id = get_user_from_token(token)
-        except Exception as e:
-            return self.send_error_json(f"Invalid token: {str(e)}", 401)
+            # Parse JSON fields from query params
+            for field in ("key_terms", "parties", "risks"):
+                if params.get(field):
+                    try:
+                        value = orjson.loads(params[field])
+                    except orjson.JSONDecodeError:
+                        continue
+                    if value is not None:
+                        contract_data[field] = value
+
+            # Build contract_files records for each file, padding missing metadata
+            metadata = (files_metadata or [])[:len(files)]
+            metadata += [{}] * (len(files) - len(metadata))
+            rows = [
+                {
+                    "contract_id": contract_id,
+                    # Storage path includes contract_id
+                    "file_path": f"{user_id}/{contract_id}/{file_data['filename']}",
+                    "file_name": file_data["filename"],
+                    "file_size_bytes": file_data["size"] if upload_token else len(file_data["content"]),
+                    "document_type": meta.get("document_type", "other"),
+                    "label": meta.get("label", file_data["filename"]),
+                    "display_order": i
+                }
+                for i, (file_data, meta) in enumerate(zip(files, metadata))
+            ]
 
-        supabase = get_supabase_client()
+            # Copy staged files or upload new ones concurrently; each is independent network I/O.
+            # Staged files are copied rather than moved so a failed confirm can be retried
+            if upload_token:
+                transfer = lambda row, file_data: supabase.storage.from_("contracts").copy(file_data["pending_path"], row["file_path"])
+            else:
+                transfer = lambda row, file_data: upload_contract_file(supabase, row["file_path"], file_data["content"])
 
-        # Update recommendation status
-        if path.startswith("/api/recommendations/"):
             try:
-                rec_id = path.split("/")[-1]
+                # Files are stored before any row exists; if a copy or upload fails, the
+                # rollback below removes whichever files did land and nothing is inserted
+                with ThreadPoolExecutor(max_workers=len(files)) as executor:
+                    list(executor.map(transfer, rows, files))
 
-                # Read body
-                content_length = int(self.headers.get("Content-Length", 0))
-                body = self.rfile.read(content_length)
-                data = json.loads(body.decode()) if body else {}
+                result = supabase.table("contracts").insert(contract_data).execute()
+                # Create all contract_files records in one insert; inserts return the new rows
+                files_result = supabase.table("contract_files").insert(rows).execute()
+            except Exception:
+                # Undo partial work so a retry doesn't leave a file-less or duplicate contract
+                try:
+                    supabase.table("contracts").delete().eq("id", contract_id).eq("user_id", user_id).execute()
+                except Exception:
+                    logger.exception("Failed to roll back contract %s", contract_id)
+                remove_contract_files(supabase, contract_id, [row["file_path"] for row in rows])
+                raise
 
-                status = data.get("status")
-                if status not in ["accepted", "dismissed"]:
-                    return self.send_error_json("Invalid status", 400)
+            if upload_token:
+                remove_contract_files(supabase, contract_id, [file_data["pending_path"] for file_data in files])
 
-                # Verify ownership
-                existing = supabase.table("recommendations").select("id").eq("id", rec_id).eq("user_id", user_id).single().execute()
-                if not existing.data:
-                    return self.send_error_json("Recommendation not found", 404)
+            contract = result.data[0]
+            contract["files"] = files_result.data
 
-                # Update status
-                result = supabase.table("recommendations").update({
-                    "status": status,
-                    "acted_on_at": "now()"
-                }).eq("id", rec_id).execute()
+            invalidate_cached_responses(user_id)
+            return self.send_json(contract)
 
-                return self.send_json(result.data[0] if result.data else {"status": "updated"})
+        except Exception as e:
+            # Details stay in the server log; clients only see the error class
+            logger.exception("Failed to save contract")
+            return self.send_error_json(f"Failed to save contract: {type(e).__name__}", 500)
 
-            except Exception as e:
-                import traceback
-                error_details = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
-                return self.send_error_json(f"Failed to update recommendation: {error_details}", 500)
+    def generate_recommendations(self, supabase, user_id, query):
+        """POST /api/recommendations/generate - generate recommendations using AI"""
+        try:
+            # Fetch all user's contracts
+            contracts = supabase.table("contracts").select(RECOMMENDATION_CONTRACT_COLUMNS).eq("user_id", user_id).execute()
+
+            if not contracts.data:
+                return self.send_json([])
+
+            # Get contract IDs that already have recommendations (any status)
+            existing_recs = supabase.table("recommendations").select("contract_id").eq("user_id", user_id).execute()
+            analyzed_contract_ids = set()
+            for rec in (existing_recs.data or []):
+                if rec.get("contract_id"):
+                    analyzed_contract_ids.add(rec["contract_id"])
+
+            # Filter to only NEW contracts (not yet analyzed)
+            new_contracts = [c for c in contracts.data if c["id"] not in analyzed_contract_ids]
+
+            if not new_contracts:
+                # No new contracts to analyze
+                return self.send_json([])
+
+            # Build context for AI - only new contracts
+            contracts_summary = []
+            for c in new_contracts:
+                contracts_summary.append({
+                    "id": c["id"],
+                    "provider": c.get("provider_name"),
+                    "nickname": c.get("contract_nickname"),
+                    "type": c.get("contract_type"),
+                    "monthly_cost": c.get("monthly_cost"),
+                    "annual_cost": c.get("annual_cost"),
+                    "start_date": c.get("start_date"),
+                    "end_date": c.get("end_date"),
+                    "auto_renewal": c.get("auto_renewal"),
+                    "cancellation_notice_days": c.get("cancellation_notice_days"),
+                    "key_terms": json_list(c.get("key_terms"))[:PROMPT_MAX_KEY_TERMS],
+                    "risks": top_risks(c.get("risks")),
+                })
 
-        return self.send_error_json("Not found", 404)
+            # Use configured AI provider
+            if AI_PROVIDER == "claude" and ANTHROPIC_API_KEY:
+                ai_result = generate_recommendations_with_claude(contracts_summary)
+            elif GEMINI_API_KEY:
+                ai_result = generate_recommendations_with_gemini(contracts_summary)
+            elif ANTHROPIC_API_KEY:
+                # Fallback to Claude if Gemini key not available
+                ai_result = generate_recommendations_with_claude(contracts_summary)
+            else:
+                return self.send_error_json("No AI provider configured. Set GEMINI_API_KEY or ANTHROPIC_API_KEY.", 500)
 
-    def do_DELETE(self):
-        """Handle DELETE requests."""
-        path = urlparse(self.path).path
+            recommendations = ai_result.get("recommendations", [])
 
-        token = parse_authorization(dict(self.headers))
-        if not token:
-            return self.send_error_json("No token provided", 401)
+            # Insert new recommendations (don't delete old ones - they're for previous contracts)
+            inserted = []
+            for rec in recommendations:
+                rec_data = {
+                    "user_id": user_id,
+                    "contract_id": rec.get("contract_id"),
+                    "type": rec.get("type", "cost_reduction"),
+                    "title": rec.get("title", "Recommendation"),
+                    "description": rec.get("description", ""),
+                    "estimated_savings": rec.get("estimated_savings"),
+                    "priority": rec.get("priority", "medium"),
+                    "status": "pending",
+                    "reasoning": rec.get("reasoning"),
+                }
+                result = supabase.table("recommendations").insert(rec_data).execute()
+                if result.data:
+                    inserted.append(result.data[0])
+
+            invalidate_cached_responses(user_id)
+            return self.send_json(inserted)
 
-        try:
-            user_id = get_user_from_token(token)
         except Exception as e:
-            return self.send_error_json(f"Invalid token: {str(e)}", 401)
+            # Details stay in the server log; clients only see the error class
+            logger.exception("Failed to generate recommendations")
+            return self.send_error_json(f"Failed to generate recommendations: {type(e).__name__}", 500)
 
-        supabase = get_supabase_client()
+    def query_contract(self, supabase, user_id, query, contract_id):
+        """POST /api/contracts/{id}/query - contract Q&A"""
+        # Verify ownership and get contract
+        result = supabase.table("contracts").select("*").eq("id", contract_id).eq("user_id", user_id).single().execute()
 
-        # Contract Q&A endpoint
-        query_match = re.match(r"/api/contracts/([^/]+)/query", path)
-        if query_match:
-            contract_id = query_match.group(1)
+        if not result.data:
+            return self.send_error_json("Contract not found", 404)
 
-            # Verify ownership and get contract
-            result = supabase.table("contracts").select("*").eq("id", contract_id).eq("user_id", user_id).single().execute()
+        contract = result.data
 
-            if not result.data:
-                return self.send_error_json("Contract not found", 404)
+        # Parse request body
+        try:
+            body = self.read_body()
+            query_data = orjson.loads(body)
+            question = query_data.get("question", "")
+        except:
+            return self.send_error_json("Invalid request body", 400)
+
+        if not question:
+            return self.send_error_json("Question is required", 400)
+
+        # RAG: Retrieve relevant chunks from the database
+        full_text = contract.get("full_text", "")
+        chunks = []
+        
+        # Try to get chunks from contract_chunks table
+        try:
+            chunks_result = supabase.table("contract_chunks").select("*").eq("contract_id", contract_id).order("chunk_index").execute()
+            chunks = [c.get("chunk_text", "") for c in chunks_result.data if c.get("chunk_text")]
+        except Exception:
+            # Fallback: use full_text if no chunks
+            pass
+
+        # If no chunks in DB but we have full_text, create chunks on-the-fly
+        if not chunks and full_text:
+            # Simple chunking by paragraphs
+            paragraphs = [p.strip() for p in full_text.split("\n\n") if p.strip()]
+            chunks = paragraphs[:20]  # Limit to first 20 paragraphs
+
+        # Retrieve relevant chunks using keyword matching
+        def find_relevant_chunks(question: str, chunks: list, top_k: int = 5) -> list:
+            """Find chunks relevant to the question using keyword matching."""
+            if not chunks:
+                return []
+            
+            # Extract keywords from question
+            question_lower = question.lower()
+            keywords = [w for w in question_lower.split() if len(w) > 3]
+            
+            # Score each chunk
+            scored = []
+            for i, chunk in enumerate(chunks):
+                chunk_lower = chunk.lower()
+                score = 0
+                for kw in keywords:
+                    score += chunk_lower.count(kw) * 2
+                # Boost chunks that are shorter (more focused)
+                if len(chunk) < 500:
+                    score *= 1.2
+                scored.append((i, score, chunk))
+            
+            # Sort by score and return top_k
+            scored.sort(key=lambda x: x[1], reverse=True)
+            return [c[2] for c in scored[:top_k] if c[1] > 0]
 
-            contract = result.data
+        relevant_chunks = find_relevant_chunks(question, chunks)
 
-            # Parse request body
+        # Build context from contract data
+        key_terms = contract.get("key_terms", [])
+        if isinstance(key_terms, str):
             try:
-                content_length = int(self.headers.get("Content-Length", 0))
-                body = self.rfile.read(content_length)
-                query_data = json.loads(body)
-                question = query_data.get("question", "")
+                key_terms = orjson.loads(key_terms)
             except:
-                return self.send_error_json("Invalid request body", 400)
-
-            if not question:
-                return self.send_error_json("Question is required", 400)
+                key_terms = [key_terms] if key_terms else []
 
-            # RAG: Retrieve relevant chunks from the database
-            full_text = contract.get("full_text", "")
-            chunks = []
-            
-            # Try to get chunks from contract_chunks table
+        parties = contract.get("parties", [])
+        if isinstance(parties, str):
             try:
-                chunks_result = supabase.table("contract_chunks").select("*").eq("contract_id", contract_id).order("chunk_index").execute()
-                chunks = [c.get("chunk_text", "") for c in chunks_result.data if c.get("chunk_text")]
-            except Exception:
-                # Fallback: use full_text if no chunks
-                pass
-
-            # If no chunks in DB but we have full_text, create chunks on-the-fly
-            if not chunks and full_text:
-                # Simple chunking by paragraphs
-                paragraphs = [p.strip() for p in full_text.split("\n\n") if p.strip()]
-                chunks = paragraphs[:20]  # Limit to first 20 paragraphs
-
-            # Retrieve relevant chunks using keyword matching
-            def find_relevant_chunks(question: str, chunks: list, top_k: int = 5) -> list:
-                """Find chunks relevant to the question using keyword matching."""
-                if not chunks:
-                    return []
-                
-                # Extract keywords from question
-                question_lower = question.lower()
-                keywords = [w for w in question_lower.split() if len(w) > 3]
-                
-                # Score each chunk
-                scored = []
-                for i, chunk in enumerate(chunks):
-                    chunk_lower = chunk.lower()
-                    score = 0
-                    for kw in keywords:
-                        score += chunk_lower.count(kw) * 2
-                    # Boost chunks that are shorter (more focused)
-                    if len(chunk) < 500:
-                        score *= 1.2
-                    scored.append((i, score, chunk))
-                
-                # Sort by score and return top_k
-                scored.sort(key=lambda x: x[1], reverse=True)
-                return [c[2] for c in scored[:top_k] if c[1] > 0]
-
-            relevant_chunks = find_relevant_chunks(question, chunks)
-
-            # Build context from contract data
-            key_terms = contract.get("key_terms", [])
-            if isinstance(key_terms, str):
-                try:
-                    key_terms = json.loads(key_terms)
-                except:
-                    key_terms = [key_terms] if key_terms else []
-
-            parties = contract.get("parties", [])
-            if isinstance(parties, str):
-                try:
-                    parties = json.loads(parties)
-                except:
-                    parties = []
+                parties = orjson.loads(parties)
+            except:
+                parties = []
 
-            risks = contract.get("risks", [])
-            if isinstance(risks, str):
-                try:
-                    risks = json.loads(risks)
-                except:
-                    risks = []
+        risks = contract.get("risks", [])
+        if isinstance(risks, str):
+            try:
+                risks = orjson.loads(risks)
+            except:
+                risks = []
 
-            # Build RAG prompt with retrieved chunks
-            context_parts = []
+        # Build RAG prompt with retrieved chunks
+        context_parts = []
 
-            # Add structured data
-            context_parts.append(f"""## Contract Details
+        # Add structured data
+        context_parts.append(f"""## Contract Details
 - **Provider:** {contract.get('provider_name', 'Unknown')}
 - **Type:** {contract.get('contract_type', 'Unknown')}
 - **Monthly Cost:** ${contract.get('monthly_cost', 'Not specified') or 'Not specified'}
@@ -1339,25 +1866,25 @@ class handler(BaseHTTPRequestHandler):
 - **Auto-Renewal:** {'Yes' if contract.get('auto_renewal') else 'No'}
 - **Cancellation Notice:** {contract.get('cancellation_notice_days', 'Not specified') or 'Not specified'} days""")
 
-            if key_terms:
-                context_parts.append(f"""## Key Terms
+        if key_terms:
+            context_parts.append(f"""## Key Terms
 {chr(10).join(f"- {term}" for term in key_terms)}""")
 
-            if parties:
-                context_parts.append(f"""## Parties
+        if parties:
+            context_parts.append(f"""## Parties
 {chr(10).join(f"- {p.get('name', 'Unknown')} ({p.get('role', 'Unknown role')})" for p in parties)}""")
 
-            if risks:
-                context_parts.append(f"""## Identified Risks
+        if risks:
+            context_parts.append(f"""## Identified Risks
 {chr(10).join(f"- {r.get('title', 'Unknown')}: {r.get('description', '')}" for r in risks)}""")
 
-            # Add relevant document chunks (RAG)
-            if relevant_chunks:
-                context_parts.append(f"""## Relevant Document Sections
+        # Add relevant document chunks (RAG)
+        if relevant_chunks:
+            context_parts.append(f"""## Relevant Document Sections
 {chr(10).join(f"[Section {i+1}] {chunk[:500]}" for i, chunk in enumerate(relevant_chunks))}""")
 
-            # Format the prompt
-            prompt = f"""You are a contract analyst assistant. Your job is to answer questions about contracts based on the provided context.
+        # Format the prompt
+        prompt = f"""You are a contract analyst assistant. Your job is to answer questions about contracts based on the provided context.
 
 {chr(10).join(context_parts)}
 
@@ -1378,66 +1905,184 @@ Return a JSON object with:
 
 Respond with ONLY valid JSON, no other text."""
 
-            # Call Claude API
+        # Call Claude API
+        try:
+            client = get_anthropic_client()
+
+            message = client.messages.create(
+                model=CLAUDE_QA_MODEL,
+                max_tokens=1024,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+
+            response_text = message.content[0].text
+
+            # Parse the JSON response
             try:
-                import anthropic
-                client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+                response_data = orjson.loads(response_text)
+                answer = response_data.get("answer", "Sorry, I couldn't parse the answer.")
+                citations = response_data.get("citations", [])
+            except orjson.JSONDecodeError:
+                # If JSON parsing fails, return the raw response
+                answer = response_text
+                citations = []
 
-                message = client.messages.create(
-                    model="claude-opus-4-20251115",
-                    max_tokens=1024,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
+            return self.send_json({"answer": answer, "citations": citations})
 
-                response_text = message.content[0].text
+        except Exception as e:
+            logger.exception("Failed to generate answer")
+            return self.send_error_json(f"Failed to generate answer: {type(e).__name__}", 500)
 
-                # Parse the JSON response
-                try:
-                    response_data = json.loads(response_text)
-                    answer = response_data.get("answer", "Sorry, I couldn't parse the answer.")
-                    citations = response_data.get("citations", [])
-                except json.JSONDecodeError:
-                    # If JSON parsing fails, return the raw response
-                    answer = response_text
-                    citations = []
+    def update_recommendation(self, supabase, user_id, query, rec_id):
+        """PUT /api/recommendations/{id} - update recommendation status"""
+        try:
+            # Read body
+            body = self.read_body()
+            data = orjson.loads(body) if body else {}
+
+            status = data.get("status")
+            if status not in ["accepted", "dismissed"]:
+                return self.send_error_json("Invalid status", 400)
+
+            # Update status; the user_id filter doubles as the ownership check
+            result = supabase.table("recommendations").update({
+                "status": status,
+                "acted_on_at": datetime.now(timezone.utc).isoformat()
+            }).eq("id", rec_id).eq("user_id", user_id).execute()
+            if not result.data:
+                return self.send_error_json("Recommendation not found", 404)
 
-                return self.send_json({"answer": answer, "citations": citations})
+            invalidate_cached_responses(user_id)
+            return self.send_json(result.data[0])
 
-            except Exception as e:
-                return self.send_error_json(f"Failed to generate answer: {str(e)}", 500)
+        except Exception as e:
+            # Details stay in the server log; clients only see the error class
+            logger.exception("Failed to update recommendation")
+            return self.send_error_json(f"Failed to update recommendation: {type(e).__name__}", 500)
 
-        if path.startswith("/api/contracts/"):
-            contract_id = path.split("/")[-1]
+    def delete_contract(self, supabase, user_id, query, contract_id):
+        """DELETE /api/contracts/{id}"""
+        if not is_uuid(contract_id):
+            return self.send_error_json("Contract not found", 404)
 
-            # Verify ownership and get contract
-            existing = supabase.table("contracts").select("id").eq("id", contract_id).eq("user_id", user_id).single().execute()
+        try:
+            # Ownership check, path lookup and delete in one round trip (migration 011)
+            try:
+                result = supabase.rpc(
+                    "delete_contract_cascade", {"p_user_id": user_id, "p_contract_id": contract_id}
+                ).execute()
+            except Exception as e:
+                # Fallback: separate calls only if the RPC is not deployed yet; any other
+                # error may come after the function already committed the delete
+                if not is_missing_function_error(e):
+                    raise
+                return self.delete_contract_without_rpc(supabase, user_id, contract_id)
 
-            if not existing.data:
+            if not result.data:
                 return self.send_error_json("Contract not found", 404)
 
-            # Get all files for this contract to delete from storage
-            files = supabase.table("contract_files").select("file_path").eq("contract_id", contract_id).execute()
+            # Cleanup finishes before responding; once the response is read, Vercel may freeze the invocation
+            remove_contract_files(supabase, contract_id, result.data["file_paths"])
 
-            # Delete files from storage
-            for file in files.data:
-                if file.get("file_path"):
-                    try:
-                        supabase.storage.from_("contracts").remove([file["file_path"]])
-                    except:
-                        pass
+            invalidate_cached_responses(user_id)
+            return self.send_json({"status": "deleted"})
 
-            # Also try to delete legacy file_path if exists
-            contract = supabase.table("contracts").select("file_path").eq("id", contract_id).single().execute()
-            if contract.data and contract.data.get("file_path"):
-                try:
-                    supabase.storage.from_("contracts").remove([contract.data["file_path"]])
-                except:
-                    pass
+        except Exception as e:
+            # Details stay in the server log; clients only see the error class
+            logger.exception("Failed to delete contract %s", contract_id)
+            return self.send_error_json(f"Failed to delete contract: {type(e).__name__}", 500)
 
-            # Delete contract (contract_files will be deleted via CASCADE)
-            supabase.table("contracts").delete().eq("id", contract_id).execute()
-            return self.send_json({"status": "deleted"})
+    def bulk_delete_contracts(self, supabase, user_id, query):
+        """POST /api/contracts/bulk_delete - delete several contracts at once"""
+        try:
+            ids = orjson.loads(self.read_body() or b"{}").get("ids")
+        except (orjson.JSONDecodeError, AttributeError):
+            return self.send_error_json("Invalid request body", 400)
+
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, str) for i in ids):
+            return self.send_error_json("ids must be a non-empty list of contract ids", 400)
+        if len(ids) > MAX_BULK_DELETE_CONTRACTS:
+            return self.send_error_json(f"Maximum {MAX_BULK_DELETE_CONTRACTS} contracts per request", 400)
+
+        # PostgREST rejects the whole in_() filter if any id is not a UUID
+        if not all(is_uuid(contract_id) for contract_id in ids):
+            return self.send_error_json("ids must be contract UUIDs", 400)
+
+        try:
+            # Owned contracts with their legacy and contract_files paths in one request;
+            # ids that are not the user's are ignored
+            owned = supabase.table("contracts").select(
+                "id, file_path, contract_files(file_path)"
+            ).in_("id", ids).eq("user_id", user_id).execute().data
+            if not owned:
+                return self.send_json({"deleted": []})
+
+            owned_ids = [c["id"] for c in owned]
+            paths = {f["file_path"] for c in owned for f in c["contract_files"] if f.get("file_path")}
+            paths.update(c["file_path"] for c in owned if c.get("file_path"))
+
+            # One DELETE (contract_files via CASCADE), then one storage call; files are only
+            # removed once their rows are gone, and both finish before the response
+            supabase.table("contracts").delete().in_("id", owned_ids).eq("user_id", user_id).execute()
+            remove_contract_files(supabase, ", ".join(owned_ids), list(paths))
+
+            invalidate_cached_responses(user_id)
+            return self.send_json({"deleted": owned_ids})
+
+        except Exception as e:
+            # Details stay in the server log; clients only see the error class
+            logger.exception("Failed to delete contracts")
+            return self.send_error_json(f"Failed to delete contracts: {type(e).__name__}", 500)
+
+    def delete_contract_without_rpc(self, supabase, user_id, contract_id):
+        """Delete a contract with table calls when delete_contract_cascade is unavailable."""
+        # Verify ownership (and read the legacy file_path) while fetching the file paths
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            existing_future = executor.submit(
+                lambda: supabase.table("contracts").select("id, file_path").eq("id", contract_id).eq("user_id", user_id).limit(1).execute()
+            )
+            files_future = executor.submit(
+                lambda: supabase.table("contract_files").select("file_path").eq("contract_id", contract_id).execute()
+            )
+            existing = existing_future.result()
+            files = files_future.result()
+
+        if not existing.data:
+            return self.send_error_json("Contract not found", 404)
+        contract = existing.data[0]
+
+        # Delete all stored files, including the legacy file_path, in one storage call
+        paths = [f["file_path"] for f in files.data if f.get("file_path")]
+        if contract.get("file_path"):
+            paths.append(contract["file_path"])
+
+        # Files are only removed once the row delete has succeeded, so a failed delete
+        # never leaves a live contract without its files (contract_files via CASCADE)
+        supabase.table("contracts").delete().eq("id", contract_id).eq("user_id", user_id).execute()
+        remove_contract_files(supabase, contract_id, paths)
+
+        invalidate_cached_responses(user_id)
+        return self.send_json({"status": "deleted"})
+
+
+# (method, path) -> handler method for exact routes
+ROUTES = {
+    ("GET", "/api/contracts"): handler.list_contracts,
+    ("GET", "/api/contracts/summary"): handler.get_summary,
+    ("GET", "/api/recommendations"): handler.list_recommendations,
+    ("POST", "/api/upload/extract"): handler.upload_extract,
+    ("POST", "/api/upload/confirm"): handler.upload_confirm,
+    ("POST", "/api/recommendations/generate"): handler.generate_recommendations,
+    ("POST", "/api/contracts/bulk_delete"): handler.bulk_delete_contracts,
+}
 
-        return self.send_error_json("Not found", 404)
+# Parametric routes, tried in order; captured groups become handler arguments
+PATTERN_ROUTES = (
+    ("GET", CONTRACT_FILES_PATH_RE, handler.get_contract_files),
+    ("GET", CONTRACT_PATH_RE, handler.get_contract),
+    ("POST", CONTRACT_QUERY_PATH_RE, handler.query_contract),
+    ("PUT", RECOMMENDATION_PATH_RE, handler.update_recommendation),
+    ("DELETE", CONTRACT_PATH_RE, handler.delete_contract),
+)
@@ -62,6 +62,18 @@ export async function deleteContract(id: string): Promise<void> {
   if (!res.ok) throw new Error('Failed to delete contract')
 }
 
+export async function deleteContracts(ids: string[]): Promise<string[]> {
+  const headers = await getAuthHeader()
+  const res = await fetch(`${API_URL}/api/contracts/bulk_delete`, {
+    method: 'POST',
+    headers: { ...headers, 'Content-Type': 'application/json' },
+    body: JSON.stringify({ ids }),
+  })
+  if (!res.ok) throw new Error('Failed to delete contracts')
+  const data: { deleted: string[] } = await res.json()
+  return data.deleted
+}
+
 // Upload API - Multi-file support
 export async function extractContracts(files: UploadFile[]): Promise<ExtractionResult> {
   const headers = await getAuthHeader()
@@ -100,21 +112,11 @@ export async function confirmContracts(
   data: Partial<ExtractionResult>
 ): Promise<Contract> {
   const headers = await getAuthHeader()
-  const formData = new FormData()
-
-  // Add all files
-  files.forEach((uploadFile, index) => {
-    formData.append(`file_${index}`, uploadFile.file)
-  })
-
-  // Add metadata as JSON
-  formData.append('files_metadata', JSON.stringify(
-    files.map(f => ({
-      filename: f.file.name,
-      document_type: f.document_type,
-      label: f.label || f.file.name
-    }))
-  ))
+  const filesMetadata = files.map(f => ({
+    filename: f.file.name,
+    document_type: f.document_type,
+    label: f.label || f.file.name
+  }))
 
   // Add extraction data as query params
   const params = new URLSearchParams()
@@ -132,11 +134,32 @@ export async function confirmContracts(
   if (data.parties && data.parties.length > 0) params.append('parties', JSON.stringify(data.parties))
   if (data.risks && data.risks.length > 0) params.append('risks', JSON.stringify(data.risks))
 
-  const res = await fetch(`${API_URL}/api/upload/confirm?${params}`, {
-    method: 'POST',
-    headers,
-    body: formData,
-  })
+  let res: Response
+  if (data.upload_token) {
+    // Files were already uploaded by extract; only send their metadata
+    params.append('upload_token', data.upload_token)
+    res = await fetch(`${API_URL}/api/upload/confirm?${params}`, {
+      method: 'POST',
+      headers: { ...headers, 'Content-Type': 'application/json' },
+      body: JSON.stringify({ files_metadata: filesMetadata }),
+    })
+  } else {
+    const formData = new FormData()
+
+    // Add all files
+    files.forEach((uploadFile, index) => {
+      formData.append(`file_${index}`, uploadFile.file)
+    })
+
+    // Add metadata as JSON
+    formData.append('files_metadata', JSON.stringify(filesMetadata))
+
+    res = await fetch(`${API_URL}/api/upload/confirm?${params}`, {
+      method: 'POST',
+      headers,
+      body: formData,
+    })
+  }
   if (!res.ok) throw new Error('Failed to save contract')
   return res.json()
 }
@@ -134,6 +134,8 @@ export interface ExtractionResult {
   // Smart routing info
   escalated?: boolean
   escalation_model?: string
+  // Files staged in storage by extract; confirm reuses them when present
+  upload_token?: string
 }
 
 export type RecommendationType =
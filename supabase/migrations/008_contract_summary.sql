@@ -0,0 +1,26 @@
+-- Dashboard summary aggregated in Postgres so the API receives one small JSON
+-- object instead of every contract row for the user
+
+CREATE OR REPLACE FUNCTION get_contract_summary(p_user_id UUID)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_contracts', COUNT(*),
+        'total_monthly_spend', COALESCE(SUM(c.monthly_cost), 0),
+        'total_annual_spend', COALESCE(SUM(c.annual_cost), 0),
+        'contracts_by_type', COALESCE((
+            SELECT json_object_agg(t.contract_type, t.count)
+            FROM (
+                SELECT COALESCE(contract_type, 'other') AS contract_type, COUNT(*) AS count
+                FROM contracts
+                WHERE user_id = p_user_id
+                GROUP BY 1
+            ) t
+        ), '{}'::json),
+        'expiring_soon', COUNT(*) FILTER (
+            WHERE c.end_date BETWEEN CURRENT_DATE AND CURRENT_DATE + 30
+        ),
+        'auto_renewal_count', COUNT(*) FILTER (WHERE c.auto_renewal)
+    )
+    FROM contracts c
+    WHERE c.user_id = p_user_id;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,4 @@
+-- Composite index for per-user date filters (summary expiring_soon count,
+-- expiring contract lookups) so they no longer scan every row for the user
+
+CREATE INDEX IF NOT EXISTS idx_contracts_user_id_end_date ON contracts(user_id, end_date);
@@ -0,0 +1,4 @@
+-- Contract list is filtered by user and ordered newest first; this index
+-- serves both, including paginated range requests
+
+CREATE INDEX IF NOT EXISTS idx_contracts_user_id_created_at ON contracts(user_id, created_at DESC);
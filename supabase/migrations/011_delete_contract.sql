@@ -0,0 +1,28 @@
+-- Delete a user's contract in one call and return the storage paths to clean up,
+-- instead of separate ownership, file path and delete round trips from the API.
+-- Returns NULL when the contract does not exist or belongs to another user.
+
+CREATE OR REPLACE FUNCTION delete_contract_cascade(p_user_id UUID, p_contract_id UUID)
+RETURNS JSON AS $$
+DECLARE
+    v_file_paths TEXT[];
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM contracts WHERE id = p_contract_id AND user_id = p_user_id
+    ) THEN
+        RETURN NULL;
+    END IF;
+
+    -- Collect paths before the delete cascades to contract_files; includes the legacy file_path
+    SELECT COALESCE(array_agg(p.file_path), '{}') INTO v_file_paths
+    FROM (
+        SELECT file_path FROM contract_files WHERE contract_id = p_contract_id
+        UNION
+        SELECT file_path FROM contracts WHERE id = p_contract_id AND file_path IS NOT NULL
+    ) p;
+
+    DELETE FROM contracts WHERE id = p_contract_id AND user_id = p_user_id;
+
+    RETURN json_build_object('file_paths', v_file_paths);
+END;
+$$ LANGUAGE plpgsql;